@@ -1,14 +1,31 @@
+import io
 import os
+import csv
+import json
+import zlib
 import uuid
 import time
-from flask import Flask, request, jsonify
+import hashlib
+import threading
+from flask import Flask, Response, g, request, jsonify, stream_with_context
 from flask_cors import CORS
+from sqlalchemy import delete, select, text
+from sqlalchemy.exc import OperationalError
 from db import Base, engine, SessionLocal
-from models import Product
-from tasks import process_csv_job, redis, redis_key, set_progress
-from config import UPLOAD_FOLDER, REDIS_URL
-from webhooks import redis as whr, WEBHOOK_SET
+from models import Product, product_filters
+from tasks import enqueue_import, upsert_statement, delete_products_job, IMPORT_MODES, IMPORT_PRIORITIES, COUNT_FIELDS
+from tasks import cancel_job, upload_key, upload_ranges_key, UPLOADS_PENDING
+from progress import redis, redis_key, set_progress, progress_channel
+from config import UPLOAD_FOLDER, REDIS_URL, SSE_COALESCE_SECONDS, SSE_HEARTBEAT_SECONDS, BULK_BATCH_SIZE
+from config import EXPORT_BATCH_SIZE, UPLOAD_CHUNK_SIZE, UPLOAD_TTL_SECONDS, JOB_TTL_SECONDS, SSE_MAX_STREAMS
+from webhooks import redis as whr, WEBHOOK_SET, DEAD_LETTER_LIST, http
+from webhooks import cached_webhooks, invalidate_registry
 from webhooks import trigger_event
+import metrics
+from import_errors import ERROR_FIELDS, errors_key, iter_errors
+import product_cache
+from product_cache import bump_catalog_version
+import feeds
 
 # create uploads folder
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
@@ -20,9 +37,58 @@ app.config["UPLOAD_FOLDER"] = UPLOAD_FOLDER
 # ensure tables exist
 Base.metadata.drop_all(bind=engine)
 Base.metadata.create_all(bind=engine)
+# the tables were just emptied: cached listings, feed fingerprints and upload
+# digests (all tied to the catalog version in Redis) no longer describe them
+bump_catalog_version()
 
 # Redis set name for jobs
 JOBS_SET = "import_jobs"
+# same job ids scored by created_at, for paging /scheduled-tasks newest first
+JOBS_INDEX = "import_jobs_by_created"
+
+# create a job's progress hash and add it to the job set + index in one round trip
+def register_job(job_id, **fields):
+    now = str(int(time.time()))
+    pipe = redis.pipeline()
+    pipe.hset(redis_key(job_id), mapping={
+        "processed": "0",
+        "total": "0",
+        "error": "",
+        "created_at": now,
+        "updated_at": now,
+        "retries": "0",
+        **fields
+    })
+    pipe.sadd(JOBS_SET, job_id)
+    pipe.zadd(JOBS_INDEX, {job_id: int(now)})
+    pipe.execute()
+
+
+# request timing for GET /metrics. Streamed responses (progress stream,
+# export) are measured up to the first byte.
+@app.before_request
+def start_timer():
+    g.request_started = time.perf_counter()
+
+
+@app.after_request
+def record_request_time(response):
+    started = g.pop("request_started", None)
+    if started is not None:
+        metrics.observe("http_request_duration_seconds", time.perf_counter() - started,
+                        method=request.method,
+                        route=request.url_rule.rule if request.url_rule else "unmatched",
+                        status=response.status_code)
+    return response
+
+
+# Prometheus scrape endpoint: request, import stage and webhook histograms
+# aggregated across all API and worker processes
+@app.get("/metrics")
+def get_metrics():
+    metrics.flush()
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
 
 # health
 @app.get("/health")
@@ -30,6 +96,52 @@ def health():
     return {"status": "ok"}, 200
 
 
+# plain csv, or gzip/zstd compressed csv (decompressed while importing)
+CSV_EXTENSIONS = (".csv", ".csv.gz", ".csv.zst", ".csv.zstd")
+
+
+def _check_upload(filename, mode, priority="normal"):
+    # error message for an unacceptable upload, None if it is fine
+    if not filename:
+        return "Empty filename"
+    if not filename.lower().endswith(CSV_EXTENSIONS):
+        return "File must be a CSV (optionally .gz or .zst compressed)"
+    # "upsert" (default), "copy" for the COPY-based bulk load path,
+    # "parallel" to shard the file across workers or "snapshot" for a full
+    # catalog that also deactivates products missing from it
+    if mode not in IMPORT_MODES:
+        return f"mode must be one of {', '.join(IMPORT_MODES)}"
+    # "normal" (default) picks a worker lane by file size, "high" / "low" force the fast / heavy lane
+    if priority not in IMPORT_PRIORITIES:
+        return f"priority must be one of {', '.join(IMPORT_PRIORITIES)}"
+    return None
+
+
+def _check_feed(feed):
+    if len(feed) > 200 or any(c.isspace() for c in feed):
+        return "feed must be at most 200 characters, without whitespace"
+    return None
+
+
+# sha256 of an upload, for spotting re-uploads of an identical file
+def _save_hashed(stream, filepath):
+    # copy to disk 1 MiB at a time, hashing on the way
+    digest = hashlib.sha256()
+    with open(filepath, "wb") as f:
+        for piece in iter(lambda: stream.read(1 << 20), b""):
+            digest.update(piece)
+            f.write(piece)
+    return digest.hexdigest()
+
+
+def _hash_file(filepath):
+    digest = hashlib.sha256()
+    with open(filepath, "rb") as f:
+        for piece in iter(lambda: f.read(1 << 20), b""):
+            digest.update(piece)
+    return digest.hexdigest()
+
+
 # upload -> enqueue job
 @app.post("/upload")
 def upload_csv():
@@ -37,43 +149,297 @@ def upload_csv():
         return jsonify({"error": "No file uploaded"}), 400
 
     file = request.files["file"]
-    if file.filename == "":
-        return jsonify({"error": "Empty filename"}), 400
-    if not file.filename.lower().endswith(".csv"):
-        return jsonify({"error": "File must be a CSV"}), 400
+    mode = request.form.get("mode", "upsert")
+    # optional feed name (e.g. a supplier): re-uploads of a feed only write changed rows
+    feed = request.form.get("feed", "")
+    priority = request.form.get("priority", "normal")
+    error = _check_upload(file.filename, mode, priority) or _check_feed(feed)
+    if error:
+        return jsonify({"error": error}), 400
 
     # generate unique filename to avoid collisions
     unique_name = f"{uuid.uuid4().hex}_{file.filename}"
     filepath = os.path.join(app.config["UPLOAD_FOLDER"], unique_name)
-    file.save(filepath)
+    digest = _save_hashed(file.stream, filepath)
+
+    job_id = start_import(unique_name, mode, digest, feed, priority)
+    return jsonify({"message": "file uploaded", "filename": unique_name, "job_id": job_id, "mode": mode, "priority": priority}), 202
 
-    # create job id and set initial progress in redis
+
+# register an import job for a file in UPLOAD_FOLDER and queue it
+def start_import(unique_name, mode, digest="", feed="", priority="normal"):
+    # create job id and set initial progress in redis; the job set + index let us list it later
     job_id = uuid.uuid4().hex
-    now = int(time.time())
-    redis.hset(redis_key(job_id), mapping={
-        "status": "uploaded",
-        "filename": unique_name,
-        "processed": "0",
-        "total": "0",
-        "last_message": "uploaded",
-        "error": "",
-        "created_at": str(now),
-        "updated_at": str(now),
-        "retries": "0"
-    })
+
+    # the same file was imported already and the catalog still holds its result
+    previous = feeds.find_duplicate(mode, feed, digest) if digest else None
+    if previous:
+        return skip_duplicate_import(job_id, unique_name, mode, feed, previous)
+
+    register_job(job_id,
+                 status="uploaded",
+                 filename=unique_name,
+                 mode=mode,
+                 feed=feed,
+                 digest=digest,
+                 priority=priority,
+                 last_message="uploaded")
 
     trigger_event("csv.uploaded", {
         "job_id": job_id,
         "filename": unique_name
     })
 
-    # add to jobs set so we can list later
-    redis.sadd(JOBS_SET, job_id)
-
     # enqueue celery task
-    process_csv_job.delay(job_id, unique_name)
+    enqueue_import(job_id, unique_name, mode, priority)
+    return job_id
+
+
+# an identical upload becomes a completed job without touching the database
+def skip_duplicate_import(job_id, unique_name, mode, feed, previous):
+    processed = str(previous["processed"])
+    register_job(job_id,
+                 status="complete",
+                 filename=unique_name,
+                 mode=mode,
+                 feed=feed,
+                 processed=processed,
+                 total=processed,
+                 unchanged=processed,
+                 duplicate_of=previous["job_id"],
+                 last_message=f"identical to job {previous['job_id']}, nothing to import")
+    if JOB_TTL_SECONDS:
+        redis.expire(redis_key(job_id), JOB_TTL_SECONDS)
+    try:
+        os.remove(os.path.join(UPLOAD_FOLDER, unique_name))
+    except OSError:
+        # non-fatal
+        pass
+
+    trigger_event("csv.uploaded", {"job_id": job_id, "filename": unique_name})
+    trigger_event("csv.completed", {
+        "job_id": job_id,
+        "filename": unique_name,
+        "processed": previous["processed"],
+        "total": previous["processed"],
+        **{field: 0 for field in COUNT_FIELDS},
+        "unchanged": previous["processed"],
+        "duplicate_of": previous["job_id"],
+    })
+    return job_id
+
+
+# Resumable chunked uploads, for files too big for one request:
+#   POST /uploads {"filename", "size", "mode"}   -> upload_id
+#   PUT /uploads/<id>?offset=N  (raw bytes body) -> write them at offset N
+#   GET /uploads/<id>                            -> received / missing ranges
+#   POST /uploads/<id>/complete                  -> import job, like /upload
+# Chunks are streamed straight into the file in UPLOAD_FOLDER, may arrive in
+# any order or in parallel, and can be re-sent after a dropped connection.
+# Received byte ranges are kept in a sorted set scored by start offset.
+# Files of uploads that are never completed are removed by
+# tasks.cleanup_abandoned_uploads once their upload hash has expired.
+
+
+def _received_ranges(upload_id):
+    # merged [start, end) ranges received so far
+    merged = []
+    for member in redis.zrange(upload_ranges_key(upload_id), 0, -1):
+        start, end = map(int, member.split(":"))
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return merged
+
+
+def _missing_ranges(received, size):
+    missing = []
+    position = 0
+    for start, end in received:
+        if start > position:
+            missing.append([position, start])
+        position = max(position, end)
+    if position < size:
+        missing.append([position, size])
+    return missing
+
+
+def _upload_status(upload_id, upload):
+    size = int(upload["size"])
+    received = _received_ranges(upload_id)
+    return {
+        "upload_id": upload_id,
+        "filename": upload["filename"],
+        "size": size,
+        "received_bytes": sum(end - start for start, end in received),
+        "received": received,
+        "missing": _missing_ranges(received, size),
+        "chunk_size": UPLOAD_CHUNK_SIZE,
+    }
+
+
+@app.post("/uploads")
+def init_upload():
+    data = request.json or {}
+    filename = os.path.basename(data.get("filename") or "")
+    mode = data.get("mode", "upsert")
+    feed = data.get("feed") or ""
+    priority = data.get("priority", "normal")
+    error = _check_upload(filename, mode, priority) or _check_feed(feed)
+    if error:
+        return jsonify({"error": error}), 400
+    try:
+        size = int(data.get("size"))
+    except (TypeError, ValueError):
+        size = -1
+    if size < 0:
+        return jsonify({"error": "size (bytes) required"}), 400
+
+    upload_id = uuid.uuid4().hex
+    unique_name = f"{upload_id}_{filename}"
+    # sized up front (sparse) so chunks can land at any offset
+    with open(os.path.join(UPLOAD_FOLDER, unique_name), "wb") as f:
+        f.truncate(size)
+
+    pipe = redis.pipeline()
+    pipe.hset(upload_key(upload_id), mapping={
+        "filename": unique_name,
+        "size": str(size),
+        "mode": mode,
+        "feed": feed,
+        "priority": priority,
+        "created_at": str(int(time.time())),
+    })
+    pipe.expire(upload_key(upload_id), UPLOAD_TTL_SECONDS)
+    pipe.zadd(UPLOADS_PENDING, {unique_name: int(time.time()) + UPLOAD_TTL_SECONDS})
+    pipe.execute()
+    return jsonify(_upload_status(upload_id, redis.hgetall(upload_key(upload_id)))), 201
+
+
+@app.put("/uploads/<upload_id>")
+def put_upload_chunk(upload_id):
+    upload = redis.hgetall(upload_key(upload_id))
+    if not upload:
+        return jsonify({"error": "upload not found"}), 404
+    size = int(upload["size"])
+    offset = request.args.get("offset", type=int)
+    length = request.content_length
+    if offset is None or offset < 0:
+        return jsonify({"error": "offset required"}), 400
+    if length is None:
+        return jsonify({"error": "Content-Length required"}), 411
+    if offset + length > size:
+        return jsonify({"error": "chunk extends past the declared size"}), 416
+
+    # copy the body to disk as it arrives, never holding the chunk in memory
+    written = 0
+    with open(os.path.join(UPLOAD_FOLDER, upload["filename"]), "r+b") as f:
+        f.seek(offset)
+        while written < length:
+            piece = request.stream.read(min(1 << 20, length - written))
+            if not piece:
+                break
+            f.write(piece)
+            written += len(piece)
+
+    # a cut-off chunk still counts for what did arrive; the client resends the rest
+    pipe = redis.pipeline()
+    if written:
+        pipe.zadd(upload_ranges_key(upload_id), {f"{offset}:{offset + written}": offset})
+    pipe.expire(upload_key(upload_id), UPLOAD_TTL_SECONDS)
+    pipe.expire(upload_ranges_key(upload_id), UPLOAD_TTL_SECONDS)
+    pipe.zadd(UPLOADS_PENDING, {upload["filename"]: int(time.time()) + UPLOAD_TTL_SECONDS})
+    pipe.execute()
+    return jsonify(_upload_status(upload_id, upload)), 200
+
+
+@app.get("/uploads/<upload_id>")
+def get_upload(upload_id):
+    upload = redis.hgetall(upload_key(upload_id))
+    if not upload:
+        return jsonify({"error": "upload not found"}), 404
+    return jsonify(_upload_status(upload_id, upload)), 200
+
+
+@app.post("/uploads/<upload_id>/complete")
+def complete_upload(upload_id):
+    upload = redis.hgetall(upload_key(upload_id))
+    if not upload:
+        return jsonify({"error": "upload not found"}), 404
+    status = _upload_status(upload_id, upload)
+    if status["missing"]:
+        return jsonify({"error": "upload incomplete", **status}), 409
+
+    # only one completion may start the import; the file stops being
+    # eligible for cleanup in the same transaction
+    pipe = redis.pipeline(transaction=True)
+    pipe.delete(upload_key(upload_id))
+    pipe.zrem(UPLOADS_PENDING, upload["filename"])
+    if not pipe.execute()[0]:
+        return jsonify({"error": "upload not found"}), 404
+    redis.delete(upload_ranges_key(upload_id))
+
+    # chunks arrive out of order, so the file is hashed once it is whole
+    digest = _hash_file(os.path.join(UPLOAD_FOLDER, upload["filename"]))
+    priority = upload.get("priority", "normal")
+    job_id = start_import(upload["filename"], upload["mode"], digest, upload.get("feed", ""), priority)
+    return jsonify({"message": "file uploaded", "filename": upload["filename"], "job_id": job_id, "mode": upload["mode"], "priority": priority}), 202
+
+
+def _int(value):
+    try:
+        return int(value or 0)
+    except (TypeError, ValueError):
+        return 0
 
-    return jsonify({"message": "file uploaded", "filename": unique_name, "job_id": job_id}), 202
+
+# percent / rate / ETA of a job, derived from its byte cursor
+def progress_stats(data):
+    processed = _int(data.get("processed"))
+    total = _int(data.get("total"))
+    bytes_read = _int(data.get("bytes_read"))
+    bytes_total = _int(data.get("bytes_total"))
+    status = data.get("status", "")
+
+    percent = 0
+    if status == "complete":
+        percent = 100
+    elif bytes_total > 0:
+        percent = round((bytes_read / bytes_total) * 100, 2)
+    elif total > 0:
+        percent = round((processed / total) * 100, 2)
+
+    # rates only cover the current run, so a resumed job is not credited
+    # with rows committed before it was retried
+    rows_per_sec = 0
+    eta_seconds = None
+    started_at = _int(data.get("started_at"))
+    if started_at:
+        end = _int(data.get("updated_at")) if status in ("complete", "failed") else time.time()
+        elapsed = end - started_at
+        if elapsed > 0:
+            rows_per_sec = round((processed - _int(data.get("start_rows"))) / elapsed, 2)
+            bytes_per_sec = (bytes_read - _int(data.get("start_bytes"))) / elapsed
+            if status != "complete" and bytes_per_sec > 0:
+                eta_seconds = round(max(bytes_total - bytes_read, 0) / bytes_per_sec)
+    if status == "complete":
+        eta_seconds = 0
+
+    return {
+        "processed": processed,
+        "total": total,
+        "bytes_read": bytes_read,
+        "bytes_total": bytes_total,
+        "percent": percent,
+        "rows_per_sec": rows_per_sec,
+        "eta_seconds": eta_seconds,
+        # inserted / updated / unchanged / duplicates
+        **{field: _int(data.get(field)) for field in COUNT_FIELDS},
+        # time spent per import stage, summed over batches/shards/runs
+        "stages_ms": {field[6:-3]: _int(value) for field, value in data.items()
+                      if field.startswith("stage_") and field.endswith("_ms")},
+    }
 
 
 # progress route to return redis data
@@ -86,48 +452,194 @@ def get_progress():
     data = redis.hgetall(key)
     if not data:
         return jsonify({"error": "job not found"}), 404
-    # convert numeric fields
-    try:
-        total = int(data.get("total", "0"))
-    except:
-        total = 0
-    try:
-        processed = int(data.get("processed", "0"))
-    except:
-        processed = 0
-    percent = 0
-    if total > 0:
-        percent = round((processed / total) * 100, 2)
-    data["percent"] = percent
+    data.update(progress_stats(data))
     return jsonify(data), 200
 
 
-# list all scheduled import tasks
+# statuses after which a job's progress no longer changes on its own
+FINAL_STATUSES = ("complete", "failed", "cancelled")
+
+
+def _sse(data, event=None):
+    msg = f"event: {event}\n" if event else ""
+    return msg + f"data: {json.dumps(data)}\n\n"
+
+
+# Server-sent progress events, driven by the worker's pub/sub updates.
+# GET /progress/stream?job_id=<id> for one job; repeat job_id or pass
+# job_ids=a,b,c to watch several. The first event per job is a full
+# snapshot, later ones only carry fields that changed. Bursts are merged
+# over SSE_COALESCE_SECONDS; an idle stream only sends a keep-alive comment
+# every SSE_HEARTBEAT_SECONDS. Ends with an "end" event once every job is final.
+#
+# A stream holds a gunicorn thread and a Redis connection for as long as it
+# is open, so at most SSE_MAX_STREAMS run per process; past that the client
+# gets a 503 and should retry later or poll GET /progress.
+_stream_slots = threading.BoundedSemaphore(SSE_MAX_STREAMS)
+
+
+@app.get("/progress/stream")
+def progress_stream():
+    job_ids = request.args.getlist("job_id")
+    job_ids += [j for j in request.args.get("job_ids", "").split(",") if j]
+    job_ids = list(dict.fromkeys(job_ids))
+    if not job_ids:
+        return jsonify({"error": "job_id required"}), 400
+    if not _stream_slots.acquire(blocking=False):
+        return jsonify({"error": "too many open progress streams, retry later or poll /progress"}), 503, {
+            "Retry-After": str(int(SSE_HEARTBEAT_SECONDS))}
+
+    def generate():
+        pubsub = redis.pubsub(ignore_subscribe_messages=True)
+        pubsub.subscribe(*[progress_channel(j) for j in job_ids])
+        try:
+            # snapshot after subscribing, so no update can slip in between
+            pipe = redis.pipeline(transaction=False)
+            for jid in job_ids:
+                pipe.hgetall(redis_key(jid))
+            state = dict(zip(job_ids, pipe.execute()))
+            sent = {}
+            for jid in job_ids:
+                if not state[jid]:
+                    yield _sse({"job_id": jid, "error": "job not found"})
+                    continue
+                snapshot = {**state[jid], **progress_stats(state[jid])}
+                sent[jid] = snapshot
+                yield _sse({"job_id": jid, **snapshot})
+
+            def done():
+                return all(not state[j] or state[j].get("status") in FINAL_STATUSES for j in job_ids)
+
+            while not done():
+                msg = pubsub.get_message(timeout=SSE_HEARTBEAT_SECONDS)
+                if msg is None:
+                    yield ": keep-alive\n\n"
+                    continue
+
+                # apply this message and anything else arriving within the window
+                changed = set()
+                deadline = time.monotonic() + SSE_COALESCE_SECONDS
+                while msg is not None:
+                    jid = msg["channel"].split(":", 1)[1]
+                    delta = json.loads(msg["data"])
+                    data = state.setdefault(jid, {})
+                    data.update(delta.get("set", {}))
+                    for field, n in delta.get("incr", {}).items():
+                        data[field] = str(int(data.get(field) or 0) + n)
+                    changed.add(jid)
+                    remaining = deadline - time.monotonic()
+                    msg = pubsub.get_message(timeout=remaining) if remaining > 0 else None
+
+                for jid in changed:
+                    current = {**state[jid], **progress_stats(state[jid])}
+                    previous = sent.get(jid, {})
+                    diff = {k: v for k, v in current.items() if previous.get(k) != v}
+                    sent[jid] = current
+                    if diff:
+                        yield _sse({"job_id": jid, **diff})
+
+            yield _sse({"job_ids": job_ids}, event="end")
+        finally:
+            pubsub.close()
+
+    response = Response(stream_with_context(generate()), mimetype="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        # keep nginx from buffering the stream
+        "X-Accel-Buffering": "no",
+    })
+    # runs when the server is done with the response, also if the client left early
+    response.call_on_close(_stream_slots.release)
+    return response
+
+
+def _backfill_jobs_index():
+    # jobs created before the index existed only live in JOBS_SET
+    if redis.zcard(JOBS_INDEX) or not redis.scard(JOBS_SET):
+        return
+    job_ids = list(redis.smembers(JOBS_SET))
+    pipe = redis.pipeline(transaction=False)
+    for jid in job_ids:
+        pipe.hget(redis_key(jid), "created_at")
+    created = pipe.execute()
+    redis.zadd(JOBS_INDEX, {jid: int(c or 0) for jid, c in zip(job_ids, created)})
+
+
+# list scheduled import tasks, newest first
+# - limit: page size (default 100)
+# - cursor: next_cursor of the previous page
+# - status: only jobs in this status
 @app.get("/scheduled-tasks")
 def list_scheduled_tasks():
-    job_ids = list(redis.smembers(JOBS_SET) or [])
+    limit = max(1, min(int(request.args.get("limit", 100)), 1000))
+    status = request.args.get("status")
+    cursor = request.args.get("cursor")
+
+    _backfill_jobs_index()
+
+    # cursor is "<created_at>:<job_id>" of the last job already returned.
+    # Jobs created in the same second come in descending id order, so paging
+    # resumes at max_score after `skip` tied jobs (those with id >= the cursor's).
+    max_score, skip = "+inf", 0
+    if cursor:
+        max_score, _, after_id = cursor.partition(":")
+        skip = sum(1 for jid in redis.zrevrangebyscore(JOBS_INDEX, max_score, max_score) if jid >= after_id)
+
     tasks = []
-    for jid in job_ids:
-        data = redis.hgetall(redis_key(jid))
-        if not data:
-            # stale id: remove from set
-            redis.srem(JOBS_SET, jid)
-            continue
-        tasks.append({
-            "job_id": jid,
-            "status": data.get("status", ""),
-            "filename": data.get("filename", ""),
-            "processed": int(data.get("processed", "0") or 0),
-            "total": int(data.get("total", "0") or 0),
-            "last_message": data.get("last_message", ""),
-            "error": data.get("error", ""),
-            "created_at": int(data.get("created_at", "0") or 0),
-            "updated_at": int(data.get("updated_at", "0") or 0),
-            "retries": int(data.get("retries", "0") or 0),
-        })
-    # sort by created_at desc
-    tasks.sort(key=lambda x: x.get("created_at", 0), reverse=True)
-    return jsonify({"tasks": tasks}), 200
+    next_cursor = None
+    # scan a bounded number of index entries so a rare status cannot make this unbounded
+    scan_budget = limit * 10
+    while len(tasks) < limit and scan_budget > 0:
+        batch = redis.zrevrangebyscore(JOBS_INDEX, max_score, "-inf", start=skip, num=limit + 1, withscores=True)
+        if not batch:
+            break
+        batch = batch[:scan_budget]
+        scan_budget -= len(batch)
+
+        pipe = redis.pipeline(transaction=False)
+        for jid, _ in batch:
+            pipe.hgetall(redis_key(jid))
+        stale = []
+        for (jid, score), data in zip(batch, pipe.execute()):
+            score = str(int(score))
+            skip = skip + 1 if score == max_score else 1
+            max_score = score
+            next_cursor = f"{max_score}:{jid}"
+            if not data:
+                # expired or deleted hash
+                stale.append((jid, score))
+                continue
+            if status and data.get("status") != status:
+                continue
+            tasks.append({
+                "job_id": jid,
+                "status": data.get("status", ""),
+                "filename": data.get("filename", ""),
+                "processed": int(data.get("processed", "0") or 0),
+                "total": int(data.get("total", "0") or 0),
+                "last_message": data.get("last_message", ""),
+                "error": data.get("error", ""),
+                "created_at": int(data.get("created_at", "0") or 0),
+                "updated_at": int(data.get("updated_at", "0") or 0),
+                "retries": int(data.get("retries", "0") or 0),
+                "priority": data.get("priority") or "normal",
+                # pending pause/cancel request
+                "control": data.get("control") or None,
+            })
+            if len(tasks) == limit:
+                break
+
+        if stale:
+            pipe = redis.pipeline(transaction=False)
+            pipe.srem(JOBS_SET, *(jid for jid, _ in stale))
+            pipe.zrem(JOBS_INDEX, *(jid for jid, _ in stale))
+            pipe.execute()
+            # removed ties no longer take up a place before the next one
+            skip -= sum(1 for _, score in stale if score == max_score)
+
+    if len(tasks) < limit and scan_budget > 0:
+        # ran off the end of the index
+        next_cursor = None
+    return jsonify({"tasks": tasks, "next_cursor": next_cursor}), 200
 
 
 # single task info (alias for progress but returns consistent structure)
@@ -138,26 +650,33 @@ def get_task(job_id: str):
     if not data:
         return jsonify({"error": "task not found"}), 404
     # prepare typed response
-    try:
-        total = int(data.get("total", "0"))
-    except:
-        total = 0
-    try:
-        processed = int(data.get("processed", "0"))
-    except:
-        processed = 0
-    percent = 0
-    if total > 0:
-        percent = round((processed / total) * 100, 2)
+    stats = progress_stats(data)
     resp = {
         "job_id": job_id,
         "status": data.get("status", ""),
         "filename": data.get("filename", ""),
-        "processed": processed,
-        "total": total,
+        "processed": stats["processed"],
+        "total": stats["total"],
         "last_message": data.get("last_message", ""),
         "error": data.get("error", ""),
-        "percent": percent,
+        "percent": stats["percent"],
+        "bytes_read": stats["bytes_read"],
+        "bytes_total": stats["bytes_total"],
+        "rows_per_sec": stats["rows_per_sec"],
+        "eta_seconds": stats["eta_seconds"],
+        **{field: stats[field] for field in COUNT_FIELDS},
+        "stages_ms": stats["stages_ms"],
+        # rows rejected so far; details via GET /task/<job_id>/errors
+        "errors_stored": redis.xlen(errors_key(job_id)),
+        # delta: only rows changed since the feed's last import were written;
+        # duplicate_of: an identical upload whose result was reused
+        "feed": data.get("feed", ""),
+        "delta": data.get("delta") == "1",
+        "duplicate_of": data.get("duplicate_of") or None,
+        "control": data.get("control") or None,
+        "priority": data.get("priority") or "normal",
+        # time slices the import has run in so far, minus one
+        "slice": int(data.get("slice", "0") or 0),
         "created_at": int(data.get("created_at", "0") or 0),
         "updated_at": int(data.get("updated_at", "0") or 0),
         "retries": int(data.get("retries", "0") or 0)
@@ -165,6 +684,29 @@ def get_task(job_id: str):
     return jsonify(resp), 200
 
 
+# rejected rows of a job as csv (row, sku, name, description, reason),
+# read from its error stream a page at a time
+@app.get("/task/<job_id>/errors")
+def get_task_errors(job_id: str):
+    if not redis.exists(redis_key(job_id)):
+        return jsonify({"error": "task not found"}), 404
+
+    def generate():
+        yield ",".join(ERROR_FIELDS) + "\r\n"
+        buf = io.StringIO()
+        writer = csv.writer(buf)
+        for n, error in enumerate(iter_errors(job_id), start=1):
+            writer.writerow([error.get(f, "") for f in ERROR_FIELDS])
+            if n % 1000 == 0:
+                yield buf.getvalue()
+                buf.seek(0)
+                buf.truncate()
+        yield buf.getvalue()
+
+    headers = {"Content-Disposition": f"attachment; filename=errors-{job_id}.csv"}
+    return Response(stream_with_context(generate()), mimetype="text/csv", headers=headers)
+
+
 # retry a failed job
 @app.post("/retry/<job_id>")
 def retry_job(job_id: str):
@@ -179,57 +721,156 @@ def retry_job(job_id: str):
     if status != "failed":
         return jsonify({"error": "only failed jobs can be retried"}), 400
 
+    if data.get("kind") == "delete":
+        # resumes after the last deleted id
+        redis.hincrby(key, "retries", 1)
+        set_progress(job_id, status="queued", last_message="retry queued", error="")
+        delete_products_job.delay(job_id, json.loads(data.get("filters") or "{}"))
+        return jsonify({"message": "retry queued", "job_id": job_id}), 202
+
     if not filepath or not os.path.exists(filepath):
         return jsonify({"error": "csv file for job not found, cannot retry"}), 400
 
     # increment retries counter
     redis.hincrby(key, "retries", 1)
-    now = int(time.time())
-    redis.hset(key, mapping={
-        "status": "queued",
-        "processed": "0",
-        "last_message": "retry queued",
-        "error": "",
-        "updated_at": str(now)
-    })
+    redis.hdel(key, "control", "stopped")
+    # offset/row_number are left alone so the job resumes after its last committed batch
+    set_progress(job_id, status="queued", last_message="retry queued", error="")
 
     # re-enqueue
-    process_csv_job.delay(job_id, filename)
+    enqueue_import(job_id, filename, data.get("mode") or "upsert", data.get("priority"))
     return jsonify({"message": "retry queued", "job_id": job_id}), 202
 
 
-# products listing (same as before)
+# Statuses of an import that has a task queued or running; pause and cancel
+# requests on those are left for the worker to pick up between batches.
+ACTIVE_STATUSES = ("uploaded", "queued", "parsing", "processing", "deactivating", "merging")
+
+
+def _import_job(job_id):
+    # (progress hash, error response)
+    data = redis.hgetall(redis_key(job_id))
+    if not data:
+        return None, (jsonify({"error": "task not found"}), 404)
+    if data.get("kind") == "delete":
+        return None, (jsonify({"error": "only import jobs can be paused or cancelled"}), 400)
+    return data, None
+
+
+@app.post("/task/<job_id>/pause")
+def pause_job(job_id: str):
+    data, error = _import_job(job_id)
+    if error:
+        return error
+    if data.get("status") not in ACTIVE_STATUSES:
+        return jsonify({"error": f"job is {data.get('status')}, only queued or running jobs can be paused"}), 409
+    set_progress(job_id, control="pause")
+    return jsonify({"message": "pause requested, the job stops after its current batch", "job_id": job_id}), 202
+
+
+@app.post("/task/<job_id>/resume")
+def resume_job(job_id: str):
+    data, error = _import_job(job_id)
+    if error:
+        return error
+    status = data.get("status")
+    if status in ACTIVE_STATUSES and data.get("control") == "pause":
+        # the worker has not stopped yet: just withdraw the request
+        redis.hdel(redis_key(job_id), "control")
+        return jsonify({"message": "pause request withdrawn", "job_id": job_id}), 200
+    if status != "paused":
+        return jsonify({"error": f"job is {status}, only paused jobs can be resumed"}), 409
+    filename = data.get("filename", "")
+    if not filename or not os.path.exists(os.path.join(UPLOAD_FOLDER, filename)):
+        return jsonify({"error": "csv file for job not found, cannot resume"}), 400
+
+    redis.hdel(redis_key(job_id), "control", "stopped")
+    # the job carries on from the cursor it stored when it paused
+    set_progress(job_id, status="queued", last_message="resume queued", error="")
+    trigger_event("csv.resumed", {"job_id": job_id, "filename": filename, "processed": int(data.get("processed") or 0)})
+    enqueue_import(job_id, filename, data.get("mode") or "upsert", data.get("priority"))
+    return jsonify({"message": "resume queued", "job_id": job_id}), 202
+
+
+@app.post("/task/<job_id>/cancel")
+def cancel_import_job(job_id: str):
+    data, error = _import_job(job_id)
+    if error:
+        return error
+    status = data.get("status")
+    if status in ACTIVE_STATUSES:
+        set_progress(job_id, control="cancel")
+        return jsonify({"message": "cancel requested, the job stops after its current batch", "job_id": job_id}), 202
+    if status not in ("paused", "failed"):
+        return jsonify({"error": f"job is {status}, it cannot be cancelled"}), 409
+    # nothing is running: cancel right here, once if requests race
+    if not redis.hsetnx(redis_key(job_id), "cancelled_at", int(time.time())):
+        return jsonify({"error": "job is already cancelled"}), 409
+    cancel_job(job_id, data.get("filename", ""))
+    return jsonify({"message": "job cancelled", "job_id": job_id}), 200
+
+
+# planner's row estimate for a query, instead of running a COUNT(*)
+def estimate_count(db, query):
+    compiled = query.statement.compile(dialect=engine.dialect)
+    plan = db.connection().exec_driver_sql("EXPLAIN (FORMAT JSON) " + str(compiled), compiled.params).scalar()
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]["Plan"]["Plan Rows"])
+
+
+# products listing
+# - page/limit: offset pagination (default)
+# - cursor: keyset pagination on id; pass next_cursor from the previous page
+#   (empty for the first page), cost does not grow with page depth
+# - count: exact (default) | estimate (planner statistics) | none
+# Responses are cached per normalized query until the catalog changes
+# (X-Cache: HIT / MISS), see product_cache.
 @app.get("/products")
 def list_products():
+    # Query params
+    page = int(request.args.get("page", 1))
+    limit = int(request.args.get("limit", 50))
+    cursor = request.args.get("cursor")
+    count_mode = request.args.get("count", "exact")
+
+    params = {
+        "page": page,
+        "limit": limit,
+        "cursor": cursor,
+        "count": count_mode,
+        **{k: request.args.get(k) or "" for k in ("sku", "name", "description")},
+        "active": request.args.get("active") if request.args.get("active") in ("true", "false") else "",
+    }
+    version, body = product_cache.lookup(params)
+    if body is not None:
+        return Response(body, mimetype="application/json", headers={"X-Cache": "HIT"})
+
     db = SessionLocal()
     try:
-        # Query params
-        page = int(request.args.get("page", 1))
-        limit = int(request.args.get("limit", 50))
-
-        sku = request.args.get("sku")
-        name = request.args.get("name")
-        description = request.args.get("description")
-        active = request.args.get("active")  # true/false
-
-        query = db.query(Product)
-
-        if sku:
-            query = query.filter(Product.sku.ilike(f"%{sku}%"))
-        if name:
-            query = query.filter(Product.name.ilike(f"%{name}%"))
-        if description:
-            query = query.filter(Product.description.ilike(f"%{description}%"))
-        if active in ["true", "false"]:
-            query = query.filter(Product.active == (active == "true"))
-
-        total = query.count()
-        products = query.offset((page - 1) * limit).limit(limit).all()
-
-        return jsonify({
+        # sku / name / description / active (true/false)
+        query = db.query(Product).filter(*product_filters(request.args))
+
+        if count_mode == "estimate":
+            total = estimate_count(db, query)
+        elif count_mode == "none":
+            total = None
+        else:
+            total = query.count()
+
+        query = query.order_by(Product.id)
+        if cursor is not None:
+            if cursor:
+                query = query.filter(Product.id > int(cursor))
+            products = query.limit(limit).all()
+        else:
+            products = query.offset((page - 1) * limit).limit(limit).all()
+
+        body = app.json.dumps({
             "page": page,
             "limit": limit,
             "total": total,
+            "next_cursor": products[-1].id if len(products) == limit else None,
             "products": [
                 {
                     "id": p.id,
@@ -240,10 +881,81 @@ def list_products():
                 }
                 for p in products
             ]
-        }), 200
+        })
     finally:
         db.close()
 
+    # stored under the version read before querying: if a write landed in
+    # between, this entry is already unreachable
+    if version is not None:
+        product_cache.store(version, params, body)
+    return Response(body, mimetype="application/json", headers={"X-Cache": "MISS"})
+
+
+# hit/miss counters and size of the GET /products cache
+@app.get("/products/cache")
+def products_cache_stats():
+    return jsonify(product_cache.stats()), 200
+
+
+EXPORT_COLUMNS = ("id", "sku", "name", "description", "active", "created_at", "updated_at")
+
+
+# stream the catalog as csv or ndjson, same filters as GET /products
+# - format: csv (default) | ndjson
+# - gzip=true: download a .gz file; otherwise the body is gzip
+#   content-encoded when the client sends Accept-Encoding: gzip
+# Rows come from a server-side cursor EXPORT_BATCH_SIZE at a time as plain
+# column tuples (no ORM objects), so memory stays flat for any catalog size.
+@app.get("/products/export")
+def export_products():
+    fmt = request.args.get("format", "csv")
+    if fmt not in ("csv", "ndjson"):
+        return jsonify({"error": "format must be csv or ndjson"}), 400
+    as_file = request.args.get("gzip") == "true"
+    compress = as_file or "gzip" in request.headers.get("Accept-Encoding", "")
+    conditions = product_filters(request.args)
+
+    def encode(rows):
+        if fmt == "ndjson":
+            return "".join(json.dumps(dict(zip(EXPORT_COLUMNS, row)), default=str) + "\n" for row in rows)
+        buf = io.StringIO()
+        csv.writer(buf).writerows(rows)
+        return buf.getvalue()
+
+    def generate():
+        # gzip container (wbits=31) so clients can gunzip the output as-is
+        gz = zlib.compressobj(6, zlib.DEFLATED, 31) if compress else None
+        db = SessionLocal()
+        try:
+            if fmt == "csv":
+                header = ",".join(EXPORT_COLUMNS) + "\r\n"
+                yield gz.compress(header.encode()) if gz else header
+            stmt = select(*(getattr(Product, c) for c in EXPORT_COLUMNS)).where(*conditions).order_by(Product.id)
+            result = db.execute(stmt.execution_options(stream_results=True, yield_per=EXPORT_BATCH_SIZE))
+            for rows in result.partitions():
+                chunk = encode(rows)
+                if gz:
+                    chunk = gz.compress(chunk.encode())
+                    if not chunk:
+                        continue
+                yield chunk
+            if gz:
+                yield gz.flush()
+        finally:
+            db.close()
+
+    ext = "csv" if fmt == "csv" else "ndjson"
+    mimetype = "text/csv" if fmt == "csv" else "application/x-ndjson"
+    headers = {"Content-Disposition": f"attachment; filename=products.{ext}"}
+    if as_file:
+        mimetype = "application/gzip"
+        headers["Content-Disposition"] += ".gz"
+    elif compress:
+        headers["Content-Encoding"] = "gzip"
+        headers["Vary"] = "Accept-Encoding"
+    return Response(stream_with_context(generate()), mimetype=mimetype, headers=headers)
+
 
 @app.post("/products")
 def create_product():
@@ -263,6 +975,7 @@ def create_product():
         )
         db.add(product)
         db.commit()
+        bump_catalog_version()
         db.refresh(product)
 
         return jsonify({"message": "Product created", "product": {
@@ -279,6 +992,98 @@ def create_product():
         db.close()
 
 
+def _bulk_items():
+    """
+    Operations of a bulk request: a JSON array, or NDJSON (one object per
+    line) which is read from the request stream line by line.
+    """
+    if request.mimetype in ("application/x-ndjson", "application/ndjson"):
+        for line in request.stream:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+    else:
+        yield from (request.get_json() or [])
+
+
+def _apply_bulk_batch(db, batch, results):
+    # the last operation on a sku decides its final state, exactly as if the
+    # batch had been applied one item at a time
+    last = {}
+    for index, item in batch:
+        if item["sku"] in last:
+            results[last[item["sku"]][0]]["status"] = "superseded"
+        last[item["sku"]] = (index, item)
+
+    upserts = {sku: (index, item) for sku, (index, item) in last.items() if item["op"] == "upsert"}
+    deletes = {sku: index for sku, (index, item) in last.items() if item["op"] == "delete"}
+
+    if upserts:
+        rows = [{
+            "name": item["name"],
+            "sku": sku,
+            "description": item.get("description", ""),
+            "active": item.get("active", True)
+        } for sku, (index, item) in upserts.items()]
+        written = {r.sku: r.inserted for r in db.execute(upsert_statement(rows))}
+        for sku, (index, item) in upserts.items():
+            if sku not in written:
+                results[index]["status"] = "unchanged"
+            else:
+                results[index]["status"] = "inserted" if written[sku] else "updated"
+
+    if deletes:
+        gone = set(db.execute(
+            delete(Product).where(Product.sku.in_(list(deletes))).returning(Product.sku)
+        ).scalars())
+        for sku, index in deletes.items():
+            results[index]["status"] = "deleted" if sku in gone else "not_found"
+
+
+# bulk upsert/delete keyed by sku, all in one transaction
+# body: [{"op": "upsert", "sku": ..., "name": ..., ...}, {"op": "delete", "sku": ...}]
+# as a JSON array or NDJSON; op defaults to upsert.
+# Runs as set-based statements in batches of BULK_BATCH_SIZE and returns
+# one result per item, in request order.
+@app.post("/products/bulk")
+def bulk_products():
+    db = SessionLocal()
+    results = []
+    try:
+        batch = []
+        for index, item in enumerate(_bulk_items()):
+            op = item.get("op", "upsert") if isinstance(item, dict) else None
+            result = {"index": index, "sku": item.get("sku") if op else None, "op": op}
+            results.append(result)
+
+            if op not in ("upsert", "delete"):
+                result.update(status="error", error="op must be upsert or delete")
+                continue
+            if not item.get("sku") or (op == "upsert" and not item.get("name")):
+                result.update(status="error", error="name & sku required" if op == "upsert" else "sku required")
+                continue
+
+            batch.append((index, {**item, "op": op}))
+            if len(batch) >= BULK_BATCH_SIZE:
+                _apply_bulk_batch(db, batch, results)
+                batch = []
+        if batch:
+            _apply_bulk_batch(db, batch, results)
+
+        db.commit()
+        bump_catalog_version()
+    except Exception as e:
+        db.rollback()
+        return jsonify({"error": str(e), "applied": False}), 400
+    finally:
+        db.close()
+
+    counts = {}
+    for result in results:
+        counts[result["status"]] = counts.get(result["status"], 0) + 1
+    return jsonify({"counts": counts, "results": results}), 200
+
+
 @app.put("/products/<int:product_id>")
 def update_product(product_id):
     data = request.json
@@ -294,6 +1099,7 @@ def update_product(product_id):
         product.active = data.get("active", product.active)
 
         db.commit()
+        bump_catalog_version()
         db.refresh(product)
 
         return jsonify({"message": "Product updated"}), 200
@@ -315,19 +1121,57 @@ def delete_product(product_id):
 
         db.delete(product)
         db.commit()
+        bump_catalog_version()
 
         return jsonify({"message": "Product deleted"}), 200
     finally:
         db.close()
 
 
+# delete products
+# - no filters: TRUNCATE, instant and without leaving dead tuples behind
+# - filters (same as GET /products, e.g. ?active=false), or mode=batched to
+#   delete everything without TRUNCATE's exclusive lock: background job that
+#   deletes in batches; poll it like an import via /task/<job_id>
 @app.delete("/products")
 def delete_all_products():
+    filters = {k: request.args[k] for k in ("sku", "name", "description", "active") if k in request.args}
+    # product_filters skips empty or unknown values, which on a delete would
+    # widen it to every product (or turn it into a TRUNCATE)
+    empty = [k for k, v in filters.items() if not v]
+    if empty:
+        return jsonify({"error": f"empty filter: {', '.join(empty)}"}), 400
+    if "active" in filters and filters["active"] not in ("true", "false"):
+        return jsonify({"error": "active must be true or false"}), 400
+    mode = request.args.get("mode", "batched" if filters else "truncate")
+    if mode not in ("truncate", "batched"):
+        return jsonify({"error": "mode must be truncate or batched"}), 400
+    if mode == "truncate" and filters:
+        return jsonify({"error": "truncate cannot be combined with filters"}), 400
+
+    if mode == "batched":
+        job_id = uuid.uuid4().hex
+        register_job(job_id,
+                     status="queued",
+                     kind="delete",
+                     filename="",
+                     filters=json.dumps(filters),
+                     last_message="delete queued")
+        delete_products_job.delay(job_id, filters)
+        return jsonify({"message": "delete queued", "job_id": job_id}), 202
+
     db = SessionLocal()
     try:
-        db.query(Product).delete()
+        # TRUNCATE waits for running import batches; don't queue behind them forever
+        db.execute(text("SET LOCAL lock_timeout = '5s'"))
+        db.execute(text("TRUNCATE products RESTART IDENTITY"))
         db.commit()
+        bump_catalog_version()
+        trigger_event("products.bulk_deleted", {"truncated": True, "filters": {}})
         return jsonify({"message": "All products deleted"}), 200
+    except OperationalError as e:
+        db.rollback()
+        return jsonify({"error": f"table busy, try again: {e.orig}"}), 409
     finally:
         db.close()
 
@@ -351,6 +1195,7 @@ def create_webhook():
         "events": events,
         "enabled": enabled
     })
+    invalidate_registry()
 
     return jsonify({"id": wid}), 201
 
@@ -358,15 +1203,7 @@ def create_webhook():
 # LIST WEBHOOKS
 @app.get("/webhooks")
 def list_webhooks():
-    ids = whr.smembers(WEBHOOK_SET)
-    hooks = []
-
-    for wid in ids:
-        data = whr.hgetall(f"webhook:{wid}")
-        if data:
-            hooks.append({ "id": wid, **data })
-
-    return jsonify(hooks), 200
+    return jsonify(cached_webhooks()), 200
 
 
 # DELETE WEBHOOK
@@ -374,6 +1211,7 @@ def list_webhooks():
 def delete_webhook(wid):
     whr.srem(WEBHOOK_SET, wid)
     whr.delete(f"webhook:{wid}")
+    invalidate_registry()
     return jsonify({"message": "deleted"}), 200
 
 
@@ -386,6 +1224,7 @@ def toggle_webhook(wid):
 
     new_value = "false" if current == "true" else "true"
     whr.hset(f"webhook:{wid}", "enabled", new_value)
+    invalidate_registry()
 
     return jsonify({"enabled": new_value}), 200
 
@@ -398,7 +1237,7 @@ def test_webhook(wid):
         return jsonify({"error": "not found"}), 404
 
     try:
-        r = requests.post(hook["url"], json={"event": "test.webhook"}, timeout=3)
+        r = http.post(hook["url"], json={"event": "test.webhook"}, timeout=3)
         return jsonify({
             "status": r.status_code,
             "ok": r.ok
@@ -407,5 +1246,13 @@ def test_webhook(wid):
         return jsonify({"error": str(e)}), 500
 
 
+# deliveries that ran out of retries, newest first
+@app.get("/webhooks/dead-letters")
+def list_dead_letters():
+    limit = int(request.args.get("limit", 100))
+    items = whr.lrange(DEAD_LETTER_LIST, 0, limit - 1)
+    return jsonify([json.loads(i) for i in items]), 200
+
+
 if __name__ == "__main__":
     app.run(host="0.0.0.0", port=5000)
@@ -0,0 +1,71 @@
+"""
+Synthetic product catalog generator for import benchmarks.
+
+    python -m bench.generate_catalog --rows 1000000 --out /tmp/catalog.csv \
+        --duplicate-rate 0.02 --missing-rate 0.001 --multiline-rate 0.2
+
+Rows are written as they are generated, so 10M-row files need no memory.
+"""
+import argparse
+import csv
+import random
+
+WORDS = (
+    "art community floor adult single type back former stock thing produce "
+    "successful hot tree past action young song tax eye little state vote "
+    "country list speech economy choice lead budget task author mention "
+    "stuff professional today door model seat fear evidence opportunity season"
+).split()
+
+
+def _sentence(rng, words):
+    return " ".join(rng.choice(WORDS) for _ in range(words)).capitalize() + "."
+
+
+def generate(out, rows, duplicate_rate=0.0, missing_rate=0.0, multiline_rate=0.0,
+             description_words=24, seed=42):
+    """
+    Write `rows` data rows to `out`:
+    - duplicate_rate: share of rows reusing an earlier sku (re-import/last-wins path)
+    - missing_rate: share of rows with an empty name or sku (validation path)
+    - multiline_rate: share of quoted descriptions spanning several lines
+    """
+    rng = random.Random(seed)
+    with open(out, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(["name", "sku", "description"])
+        for i in range(rows):
+            if i and rng.random() < duplicate_rate:
+                sku = f"sku-{rng.randrange(i):09d}"
+            else:
+                sku = f"sku-{i:09d}"
+            name = " ".join(rng.choice(WORDS) for _ in range(3)).title()
+
+            sentences = [_sentence(rng, max(3, description_words // 3)) for _ in range(3)]
+            sep = "\n" if rng.random() < multiline_rate else " "
+            description = sep.join(sentences)
+
+            if rng.random() < missing_rate:
+                if rng.random() < 0.5:
+                    name = ""
+                else:
+                    sku = ""
+            writer.writerow([name, sku, description])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=10000)
+    parser.add_argument("--out", required=True)
+    parser.add_argument("--duplicate-rate", type=float, default=0.0)
+    parser.add_argument("--missing-rate", type=float, default=0.0)
+    parser.add_argument("--multiline-rate", type=float, default=0.0)
+    parser.add_argument("--description-words", type=int, default=24)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+    generate(args.out, args.rows, args.duplicate_rate, args.missing_rate,
+             args.multiline_rate, args.description_words, args.seed)
+
+
+if __name__ == "__main__":
+    main()
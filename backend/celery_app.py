@@ -0,0 +1,29 @@
+from celery import Celery
+from celery.signals import worker_process_init
+from config import REDIS_URL, WORKER_MAX_MEMORY_PER_CHILD, WORKER_MAX_TASKS_PER_CHILD, WORKER_PREFETCH_MULTIPLIER
+from config import UPLOAD_CLEANUP_INTERVAL
+
+# Celery
+celery_app = Celery("tasks", broker=REDIS_URL, backend=REDIS_URL, include=["tasks", "webhooks"])
+celery_app.conf.task_soft_time_limit = 1800  # 30m task soft limit; tune as needed
+# webhook deliveries get their own queue/worker so slow subscribers never hold up imports;
+# imports go to "imports_fast", "celery" or "imports_heavy" by priority and
+# size (tasks.import_queue)
+celery_app.conf.task_routes = {"webhooks.*": {"queue": "webhooks"}}
+# long acks_late tasks: take one message at a time so queued jobs are not
+# stuck behind a busy child while another one is idle
+celery_app.conf.worker_prefetch_multiplier = WORKER_PREFETCH_MULTIPLIER
+# recycle prefork children that grew too big (a huge batch, leaked buffers)
+celery_app.conf.worker_max_memory_per_child = WORKER_MAX_MEMORY_PER_CHILD or None
+celery_app.conf.worker_max_tasks_per_child = WORKER_MAX_TASKS_PER_CHILD or None
+# periodic jobs, run by the `beat` service
+celery_app.conf.beat_schedule = {
+    "cleanup-abandoned-uploads": {"task": "tasks.cleanup_abandoned_uploads", "schedule": UPLOAD_CLEANUP_INTERVAL},
+}
+
+
+@worker_process_init.connect
+def _reset_db_pool(**kwargs):
+    # pooled connections inherited from the parent must not be shared across forks
+    from db import engine
+    engine.dispose(close=False)
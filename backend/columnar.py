@@ -0,0 +1,182 @@
+import re
+import csv
+from itertools import count, repeat
+
+from csv_stream import _LineCounter, open_csv, iter_csv_batches
+from import_errors import row_error
+
+# pyarrow is optional: pip install pyarrow, then IMPORT_PARSER=arrow
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pacsv
+    import pyarrow.compute as pc
+except ImportError:
+    pa = None
+
+FIELDS = ("name", "sku", "description")
+
+# exactly what str.strip() removes, so trimming matches the row-by-row path
+PY_WHITESPACE = "".join(chr(i) for i in range(0x3001) if chr(i).isspace())
+
+# a quote with ordinary characters on both sides is literal text to Python's
+# csv module; blocks are cut by quote parity, which such quotes would break
+_STRAY_QUOTE = re.compile(rb'[^,\n"]"[^,\r\n"]')
+
+
+def available():
+    return pa is not None
+
+
+class ColumnBatch:
+    """
+    Rows of one block after validation, whitespace trimming and last-row-wins
+    deduplication, kept column by column. upsert_products and
+    copy_upsert_products take it in place of a list of row dicts.
+    """
+
+    def __init__(self, names, skus, descriptions, row_nums, duplicates):
+        self.names = names
+        self.skus = skus
+        self.descriptions = descriptions
+        self.row_nums = row_nums
+        self.duplicates = duplicates
+
+    def __len__(self):
+        return len(self.skus)
+
+    def records(self):
+        # insert().values() input
+        return [
+            {"name": n, "sku": s, "description": d, "active": True}
+            for n, s, d in zip(self.names, self.skus, self.descriptions)
+        ]
+
+    def copy_records(self):
+        # import_staging (row_num, name, sku, description, active) tuples
+        return zip(count(), self.names, self.skus, self.descriptions, repeat("true"))
+
+    def rows(self):
+        # row dicts as prepare_rows builds them, for bisecting a failed batch
+        return [dict(r, row_num=n) for r, n in zip(self.records(), self.row_nums)]
+
+    def take(self, indices):
+        # the rows at `indices`, e.g. only those a delta import has to write;
+        # this batch's duplicates are not counted again
+        return ColumnBatch([self.names[i] for i in indices],
+                           [self.skus[i] for i in indices],
+                           [self.descriptions[i] for i in indices],
+                           [self.row_nums[i] for i in indices],
+                           0)
+
+
+def _read_block(f, size):
+    """
+    About `size` bytes of csv, extended to the end of a record: a line break
+    with an even number of quotes before it is outside any quoted value.
+    """
+    data = f.read(size)
+    quotes = data.count(b'"')
+    while data and (not data.endswith(b"\n") or quotes % 2):
+        line = f.readline()
+        if not line:
+            break
+        data += line
+        quotes += line.count(b'"')
+    return data
+
+
+def _table_from_rows(rows):
+    # a DictReader batch as a columnar table, for the fallback path
+    return pa.table({field: pa.array([r.get(field) or "" for r in rows], pa.string()) for field in FIELDS})
+
+
+def iter_column_batches(filepath, block_size, fallback_batch_size, offset=0, row_number=0):
+    """
+    Columnar counterpart of csv_stream.iter_csv_batches: yields
+    (table, offset, row_number, read) with the raw name/sku/description
+    columns of roughly `block_size` bytes of the file per table. The cursor
+    values are the same as the row-by-row reader's, so either parser can
+    resume a job the other started.
+
+    Anything pyarrow would read differently from csv.DictReader (short or
+    long rows, stray quotes, invalid utf-8, duplicate headers) switches the
+    rest of the file to iter_csv_batches, so results never differ.
+    """
+    f, raw = open_csv(filepath)
+    with raw, f:
+        compressed = f is not raw
+        lines = _LineCounter(f, compressed)
+        header = next(csv.reader(lines), None)
+        if header is None:
+            # empty file
+            return
+        if offset > lines.offset:
+            lines.seek(offset)
+        offset = lines.offset
+
+        present = [field for field in FIELDS if field in header]
+        columnar = len(set(header)) == len(header)
+        read_options = pacsv.ReadOptions(column_names=header, use_threads=False)
+        parse_options = pacsv.ParseOptions(newlines_in_values=True)
+        convert_options = pacsv.ConvertOptions(column_types={c: pa.string() for c in header},
+                                               include_columns=present,
+                                               strings_can_be_null=False)
+
+        while columnar:
+            block = _read_block(f, block_size)
+            if not block:
+                return
+            if _STRAY_QUOTE.search(block):
+                break
+            try:
+                table = pacsv.read_csv(pa.BufferReader(block), read_options=read_options,
+                                       parse_options=parse_options, convert_options=convert_options)
+            except (pa.ArrowInvalid, pa.ArrowNotImplementedError):
+                break
+            for field in FIELDS:
+                if field not in present:
+                    table = table.append_column(field, pa.array([""] * table.num_rows, pa.string()))
+
+            offset += len(block)
+            row_number += table.num_rows
+            if table.num_rows:
+                yield table, offset, row_number, raw.tell() if compressed else offset
+
+    # row-by-row from the start of the block pyarrow could not take
+    for rows, offset, row_number, read in iter_csv_batches(filepath, fallback_batch_size, offset, row_number):
+        yield _table_from_rows(rows), offset, row_number, read
+
+
+def prepare_columns(table, first_row):
+    """
+    prepare_rows for a columnar table: the same trimming, required-field and
+    NUL checks and the same error entries, as whole-column operations, plus
+    dedupe_rows' last-row-wins. Returns (ColumnBatch, errors).
+    """
+    columns = {field: table[field].combine_chunks() for field in FIELDS}
+    index = pa.array(range(table.num_rows), pa.int64())
+    name, sku, description = (pc.utf8_trim(columns[field], characters=PY_WHITESPACE) for field in FIELDS)
+
+    missing = pc.or_(pc.equal(pc.utf8_length(name), 0), pc.equal(pc.utf8_length(sku), 0))
+    has_nul = pc.or_(pc.or_(pc.match_substring(name, "\x00"), pc.match_substring(sku, "\x00")),
+                     pc.match_substring(description, "\x00"))
+    bad = pc.or_(missing, has_nul)
+
+    # rejected rows are usually few, so they are reported one by one
+    errors = []
+    for i in pc.filter(index, bad).to_pylist():
+        reason = "missing name or sku" if missing[i].as_py() else "contains a NUL character"
+        errors.append(row_error({field: columns[field][i].as_py() for field in FIELDS}, reason, first_row + i + 1))
+
+    valid = pa.table({"name": name, "sku": sku, "description": description, "index": index}).filter(pc.invert(bad))
+    # last occurrence of every sku, in file order
+    valid = valid.append_column("position", pa.array(range(valid.num_rows), pa.int64()))
+    last = valid.group_by("sku").aggregate([("position", "max")])["position_max"].combine_chunks()
+    unique = valid.take(pc.take(last, pc.array_sort_indices(last)))
+
+    batch = ColumnBatch(unique["name"].to_pylist(),
+                        unique["sku"].to_pylist(),
+                        unique["description"].to_pylist(),
+                        [first_row + i + 1 for i in unique["index"].to_pylist()],
+                        valid.num_rows - unique.num_rows)
+    return batch, errors
@@ -4,3 +4,72 @@ DATABASE_URL = os.getenv("DATABASE_URL", "postgresql://postgres:postgres@db:5432
 REDIS_URL = os.getenv("REDIS_URL", "redis://redis:6379/0")
 UPLOAD_FOLDER = os.getenv("UPLOAD_FOLDER", "uploads")
 CHUNK_SIZE = int(os.getenv("CHUNK_SIZE", 50))
+# batch size for the COPY-based bulk import mode
+COPY_CHUNK_SIZE = int(os.getenv("COPY_CHUNK_SIZE", 10000))
+# approximate byte size of each shard in the parallel import mode
+SHARD_SIZE_BYTES = int(os.getenv("SHARD_SIZE_BYTES", 16 * 1024 * 1024))
+# webhook delivery
+WEBHOOK_TIMEOUT = float(os.getenv("WEBHOOK_TIMEOUT", 3))
+WEBHOOK_MAX_RETRIES = int(os.getenv("WEBHOOK_MAX_RETRIES", 5))
+WEBHOOK_BACKOFF_SECONDS = int(os.getenv("WEBHOOK_BACKOFF_SECONDS", 2))
+# max concurrent deliveries per webhook endpoint
+WEBHOOK_MAX_INFLIGHT = int(os.getenv("WEBHOOK_MAX_INFLIGHT", 4))
+WEBHOOK_DEAD_LETTER_MAX = int(os.getenv("WEBHOOK_DEAD_LETTER_MAX", 1000))
+# max age of the in-process webhook registry if no invalidation arrives
+WEBHOOK_REGISTRY_TTL = int(os.getenv("WEBHOOK_REGISTRY_TTL", 300))
+# progress hash writes are batched: at most one per interval (seconds) or rows
+PROGRESS_FLUSH_INTERVAL = float(os.getenv("PROGRESS_FLUSH_INTERVAL", 1.0))
+PROGRESS_FLUSH_ROWS = int(os.getenv("PROGRESS_FLUSH_ROWS", 5000))
+# completed job progress hashes expire after this many seconds (0 = keep forever)
+JOB_TTL_SECONDS = int(os.getenv("JOB_TTL_SECONDS", 7 * 24 * 3600))
+# GET /progress/stream: window for merging bursts of updates and keep-alive period (seconds)
+SSE_COALESCE_SECONDS = float(os.getenv("SSE_COALESCE_SECONDS", 0.25))
+SSE_HEARTBEAT_SECONDS = float(os.getenv("SSE_HEARTBEAT_SECONDS", 15))
+# open progress streams per API process; each holds a gunicorn thread, so keep
+# this below the thread count (16 in the Dockerfile) to leave room for other requests
+SSE_MAX_STREAMS = int(os.getenv("SSE_MAX_STREAMS", 8))
+# operations per set-based statement in POST /products/bulk
+BULK_BATCH_SIZE = int(os.getenv("BULK_BATCH_SIZE", 1000))
+# rows fetched per server-side cursor round trip in GET /products/export
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", 5000))
+# rows per transaction in filtered bulk deletes
+DELETE_BATCH_SIZE = int(os.getenv("DELETE_BATCH_SIZE", 5000))
+# metrics: seconds between pushes of a process's buffered histograms to Redis
+METRICS_FLUSH_INTERVAL = float(os.getenv("METRICS_FLUSH_INTERVAL", 5.0))
+# rejected rows kept per job in its errors stream (the error count stays exact past it)
+IMPORT_ERRORS_MAX = int(os.getenv("IMPORT_ERRORS_MAX", 100000))
+# chunked uploads: suggested chunk size, and how long an unfinished upload is kept (seconds)
+UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", 8 * 1024 * 1024))
+UPLOAD_TTL_SECONDS = int(os.getenv("UPLOAD_TTL_SECONDS", 24 * 3600))
+# seconds between sweeps for files of expired, never completed chunked uploads
+UPLOAD_CLEANUP_INTERVAL = int(os.getenv("UPLOAD_CLEANUP_INTERVAL", 3600))
+# csv parser for the serial import path: "python" (row by row) or "arrow"
+# (columnar blocks of COLUMNAR_BLOCK_SIZE bytes, needs pyarrow)
+IMPORT_PARSER = os.getenv("IMPORT_PARSER", "python")
+COLUMNAR_BLOCK_SIZE = int(os.getenv("COLUMNAR_BLOCK_SIZE", 1024 * 1024))
+# SQLAlchemy connection pool, per process (each gunicorn worker / celery child has its own)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 5))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", 10))
+DB_POOL_TIMEOUT = int(os.getenv("DB_POOL_TIMEOUT", 30))
+# seconds before a pooled connection is replaced (-1 = never)
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", 1800))
+# server-side statement timeout in milliseconds (0 = none)
+DB_STATEMENT_TIMEOUT_MS = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", 0))
+# DATABASE_URL points at PgBouncer (transaction pooling): no client-side pool
+# and no startup options, which PgBouncer rejects
+PGBOUNCER = os.getenv("PGBOUNCER", "false").lower() == "true"
+# celery prefork children are replaced once they grow past this (KiB, 0 = never)
+# or after this many tasks (0 = never)
+WORKER_MAX_MEMORY_PER_CHILD = int(os.getenv("WORKER_MAX_MEMORY_PER_CHILD", 1024 * 1024))
+WORKER_MAX_TASKS_PER_CHILD = int(os.getenv("WORKER_MAX_TASKS_PER_CHILD", 0))
+WORKER_PREFETCH_MULTIPLIER = int(os.getenv("WORKER_PREFETCH_MULTIPLIER", 1))
+# uploads at least this big (bytes) are imported on the imports_heavy queue
+IMPORT_HEAVY_BYTES = int(os.getenv("IMPORT_HEAVY_BYTES", 100 * 1024 * 1024))
+# uploads smaller than this (bytes) are imported on the imports_fast queue
+IMPORT_FAST_BYTES = int(os.getenv("IMPORT_FAST_BYTES", 1024 * 1024))
+# a serial import re-queues itself after running this long (seconds, 0 = never)
+IMPORT_SLICE_SECONDS = int(os.getenv("IMPORT_SLICE_SECONDS", 60))
+# GET /products response cache: entry TTL (seconds, 0 = off), max entries, max body size (bytes)
+PRODUCTS_CACHE_TTL = int(os.getenv("PRODUCTS_CACHE_TTL", 60))
+PRODUCTS_CACHE_MAX_ENTRIES = int(os.getenv("PRODUCTS_CACHE_MAX_ENTRIES", 10000))
+PRODUCTS_CACHE_MAX_BYTES = int(os.getenv("PRODUCTS_CACHE_MAX_BYTES", 1024 * 1024))
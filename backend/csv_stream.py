@@ -0,0 +1,156 @@
+import io
+import csv
+import gzip
+
+# zstd support is optional: pip install zstandard
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+GZIP_MAGIC = b"\x1f\x8b"
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+
+
+def compression(filepath):
+    """
+    "gzip", "zstd" or None, from the file's magic bytes
+    """
+    with open(filepath, "rb") as f:
+        head = f.read(4)
+    if head.startswith(GZIP_MAGIC):
+        return "gzip"
+    if head.startswith(ZSTD_MAGIC):
+        return "zstd"
+    return None
+
+
+def open_csv(filepath):
+    """
+    Open an upload for reading, decompressing gzip/zstd on the fly.
+    Returns (stream, raw): the decompressed binary stream and the file on
+    disk, whose position tells how much of the upload has been consumed.
+    """
+    raw = open(filepath, "rb")
+    kind = compression(filepath)
+    if kind == "gzip":
+        return gzip.GzipFile(fileobj=raw, mode="rb"), raw
+    if kind == "zstd":
+        if zstandard is None:
+            raw.close()
+            raise RuntimeError("zstd-compressed upload but the zstandard package is not installed")
+        return io.BufferedReader(zstandard.ZstdDecompressor().stream_reader(raw)), raw
+    return raw, raw
+
+
+class _LineCounter:
+    """
+    Line iterator over a binary file that keeps track of how many bytes
+    have been handed to the csv reader. csv.reader only pulls the lines it
+    needs for the current record, so after each record `offset` is the
+    byte position of the next record boundary.
+    """
+
+    def __init__(self, f, compressed=False):
+        self.f = f
+        self.compressed = compressed
+        self.offset = 0
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        raw = self.f.readline()
+        if not raw:
+            raise StopIteration
+        self.offset += len(raw)
+        return raw.decode("utf-8")
+
+    def seek(self, offset):
+        if not self.compressed:
+            self.f.seek(offset)
+        else:
+            # compressed: decompress forward to the position
+            remaining = offset - self.offset
+            while remaining > 0:
+                chunk = self.f.read(min(remaining, 1 << 20))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+        self.offset = offset
+
+
+def iter_csv_batches(filepath, batch_size, offset=0, row_number=0, end=None):
+    """
+    Stream a CSV file forward-only as batches of row dicts.
+
+    Yields (rows, offset, row_number, read) where offset is the byte position
+    just past the last record of the batch and row_number the number of data
+    rows consumed so far. Passing a previously yielded offset/row_number
+    resumes right after that batch without re-reading the rows before it. If
+    `end` is given, reading stops at the first record starting at or after it.
+
+    gzip/zstd files are decompressed as they are read; offsets then count
+    decompressed bytes and `read` is how far into the file on disk the
+    decompressor got (for progress). For plain files read == offset.
+    """
+    f, raw = open_csv(filepath)
+    with raw, f:
+        compressed = f is not raw
+        lines = _LineCounter(f, compressed)
+        position = raw.tell if compressed else (lambda: lines.offset)
+        reader = csv.DictReader(lines)
+        if reader.fieldnames is None:
+            # empty file
+            return
+        if offset > lines.offset:
+            lines.seek(offset)
+
+        batch = []
+        while end is None or lines.offset < end:
+            row = next(reader, None)
+            if row is None:
+                break
+            batch.append(row)
+            row_number += 1
+            if len(batch) >= batch_size:
+                yield batch, lines.offset, row_number, position()
+                batch = []
+        if batch:
+            yield batch, lines.offset, row_number, position()
+
+
+def plan_shards(filepath, shard_bytes):
+    """
+    Split a CSV file into byte ranges of roughly `shard_bytes` that start and
+    end on record boundaries. The file is scanned with the csv parser itself,
+    so quoted values spanning several lines never get cut in half.
+
+    Returns (shards, total) where shards is a list of (start, end, first_row)
+    tuples (first_row = data rows before the shard) and total is the number
+    of data rows in the file. Plain files only: byte ranges of a compressed
+    stream cannot be read independently.
+    """
+    shards = []
+    row_number = 0
+    with open(filepath, "rb") as f:
+        lines = _LineCounter(f)
+        reader = csv.reader(lines)
+        header = next(reader, None)
+        if header is None:
+            return shards, row_number
+
+        start = lines.offset
+        first_row = 0
+        for values in reader:
+            if not values:
+                # blank line, DictReader skips these as well
+                continue
+            row_number += 1
+            if lines.offset - start >= shard_bytes:
+                shards.append((start, lines.offset, first_row))
+                start = lines.offset
+                first_row = row_number
+        if lines.offset > start:
+            shards.append((start, lines.offset, first_row))
+    return shards, row_number
@@ -1,7 +1,30 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
 from sqlalchemy.orm import sessionmaker, declarative_base
-from config import DATABASE_URL
+from sqlalchemy.pool import NullPool
+from config import DATABASE_URL, PGBOUNCER, DB_STATEMENT_TIMEOUT_MS
+from config import DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT, DB_POOL_RECYCLE
+
+if PGBOUNCER:
+    # PgBouncer does the pooling; a server connection is only ours for one transaction
+    engine = create_engine(DATABASE_URL, poolclass=NullPool)
+else:
+    connect_args = {}
+    if DB_STATEMENT_TIMEOUT_MS:
+        connect_args["options"] = f"-c statement_timeout={DB_STATEMENT_TIMEOUT_MS}"
+    engine = create_engine(DATABASE_URL,
+                           pool_pre_ping=True,
+                           pool_size=DB_POOL_SIZE,
+                           max_overflow=DB_MAX_OVERFLOW,
+                           pool_timeout=DB_POOL_TIMEOUT,
+                           pool_recycle=DB_POOL_RECYCLE,
+                           connect_args=connect_args)
+
+if PGBOUNCER and DB_STATEMENT_TIMEOUT_MS:
+    # session settings would leak to other clients in transaction pooling, so
+    # the timeout is set per transaction instead
+    @event.listens_for(engine, "begin")
+    def _statement_timeout(conn):
+        conn.exec_driver_sql(f"SET LOCAL statement_timeout = {DB_STATEMENT_TIMEOUT_MS}")
 
-engine = create_engine(DATABASE_URL, pool_pre_ping=True)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
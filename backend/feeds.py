@@ -0,0 +1,108 @@
+import json
+import hashlib
+from progress import redis
+from product_cache import catalog_version
+from config import JOB_TTL_SECONDS
+
+# Delta imports and duplicate-upload detection.
+#
+# A feed (the `feed` field of an upload, e.g. a supplier name) keeps the
+# fingerprint of every sku it last imported in one Redis hash, sku -> 16 hex
+# chars. Re-uploads of the feed only write rows whose fingerprint changed.
+# Identical files (same sha256, mode and feed) skip the import altogether.
+#
+# Both are only trusted while the catalog version is still the one recorded
+# when the feed's last import finished: any other write to products (manual
+# edits, deletes, truncate, other feeds) makes the next import a full one,
+# which also rebuilds the fingerprints.
+
+
+def fingerprints_key(feed):
+    return f"feed_fingerprints:{feed}"
+
+
+def feed_version_key(feed):
+    return f"feed_version:{feed}"
+
+
+def digest_key(mode, feed, digest):
+    return f"upload_digest:{mode}:{feed}:{digest}"
+
+
+def fingerprint(name, description):
+    return hashlib.blake2b(f"{name}\x1f{description}".encode(), digest_size=8).hexdigest()
+
+
+def start_delta(feed):
+    """
+    Returns (delta, version): whether the feed's fingerprints can be used for
+    this import, and the catalog version they were checked against. Unusable
+    fingerprints are dropped; the import then writes every row.
+    """
+    version = catalog_version()
+    stored = redis.get(feed_version_key(feed))
+    if stored is not None and int(stored) == version:
+        return True, version
+    pipe = redis.pipeline()
+    pipe.unlink(fingerprints_key(feed))
+    pipe.delete(feed_version_key(feed))
+    pipe.execute()
+    return False, version
+
+
+def changed_rows(feed, skus, names, descriptions):
+    """
+    Indices of the rows whose content differs from what the feed last
+    imported (new skus included), and their fingerprints by sku.
+    """
+    if not skus:
+        return [], {}
+    fps = [fingerprint(n, d) for n, d in zip(names, descriptions)]
+    stored = redis.hmget(fingerprints_key(feed), skus)
+    keep = [i for i, (fp, old) in enumerate(zip(fps, stored)) if fp != old]
+    return keep, {skus[i]: fps[i] for i in keep}
+
+
+def save_fingerprints(feed, fps):
+    # only after the rows they describe are committed
+    if fps:
+        redis.hset(fingerprints_key(feed), mapping=fps)
+
+
+def forget_skus(feed, skus):
+    # rows changed behind the feed's back (e.g. deactivated by a snapshot)
+    if skus:
+        redis.hdel(fingerprints_key(feed), *skus)
+
+
+def finish_feed(feed, chain):
+    """
+    Trust the fingerprints for the next import only if nobody else wrote to
+    products while this one ran
+    """
+    if chain.intact:
+        redis.set(feed_version_key(feed), chain.version)
+    else:
+        redis.delete(feed_version_key(feed))
+
+
+def find_duplicate(mode, feed, digest):
+    """
+    The completed import of an identical file whose result is still what
+    the catalog holds, or None
+    """
+    data = redis.get(digest_key(mode, feed, digest))
+    if not data:
+        return None
+    previous = json.loads(data)
+    if previous["version"] != catalog_version():
+        return None
+    return previous
+
+
+def record_digest(mode, feed, digest, job_id, processed, chain):
+    if not chain.intact:
+        return
+    redis.set(digest_key(mode, feed, digest),
+              json.dumps({"job_id": job_id, "processed": processed, "version": chain.version}),
+              ex=JOB_TTL_SECONDS or None)
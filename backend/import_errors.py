@@ -0,0 +1,55 @@
+from progress import redis
+from config import IMPORT_ERRORS_MAX
+
+# Rows an import rejected, one capped Redis stream per job. Entries are
+# appended batch by batch and read back page by page, so neither the worker
+# nor the CSV download ever holds a job's errors in memory.
+ERROR_FIELDS = ("row", "sku", "name", "description", "reason")
+# long values are cut so a bad file cannot blow up the stream
+ERROR_VALUE_CHARS = 200
+
+
+def errors_key(job_id):
+    return f"errors:{job_id}"
+
+
+def row_error(row, reason, row_num=None):
+    """
+    Error entry for a raw csv row or a prepared row
+    """
+    def clip(value):
+        # NUL is dropped so the errors csv stays readable
+        return (value or "").replace("\x00", "")[:ERROR_VALUE_CHARS]
+
+    return {
+        "row": row_num if row_num is not None else row.get("row_num", ""),
+        "sku": clip(row.get("sku")),
+        "name": clip(row.get("name")),
+        "description": clip(row.get("description")),
+        "reason": clip(reason),
+    }
+
+
+def record_errors(job_id, errors):
+    if not errors:
+        return
+    pipe = redis.pipeline(transaction=False)
+    for error in errors:
+        pipe.xadd(errors_key(job_id), {f: str(error.get(f, "")) for f in ERROR_FIELDS},
+                  maxlen=IMPORT_ERRORS_MAX, approximate=True)
+    pipe.execute()
+
+
+def iter_errors(job_id, page_size=1000):
+    """
+    Yield every stored error of a job, oldest first
+    """
+    start = "-"
+    while True:
+        entries = redis.xrange(errors_key(job_id), min=start, count=page_size)
+        for _, fields in entries:
+            yield fields
+        if len(entries) < page_size:
+            return
+        # exclusive range: continue after the last id seen
+        start = "(" + entries[-1][0]
@@ -0,0 +1,152 @@
+import time
+import threading
+from contextlib import contextmanager
+from redis import Redis
+from config import REDIS_URL, METRICS_FLUSH_INTERVAL
+
+# Histograms shared by every API and worker process. Each process buffers its
+# observations and adds them to one Redis hash every METRICS_FLUSH_INTERVAL
+# seconds, so timing a stage costs no round trip. GET /metrics renders the
+# hash in the Prometheus text format.
+redis = Redis.from_url(REDIS_URL, decode_responses=True)
+
+METRICS_KEY = "metrics:histograms"
+
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300)
+
+HELP = {
+    "import_stage_seconds": "Time spent per import pipeline stage and batch",
+    "http_request_duration_seconds": "Flask request handling time (time to first byte for streamed responses)",
+    "webhook_enqueue_seconds": "Time to queue an event for webhook delivery",
+    "webhook_delivery_seconds": "Webhook HTTP delivery time",
+}
+
+_lock = threading.Lock()
+_buffer = {}
+_last_flush = [time.monotonic()]
+
+
+def _labels(labels):
+    return ",".join(f'{k}="{v}"' for k, v in sorted(labels.items()))
+
+
+def observe(name, seconds, **labels):
+    """
+    Record one observation of `name` (seconds) in the local buffer
+    """
+    bucket = next((le for le in BUCKETS if seconds <= le), "+Inf")
+    prefix = f"{name}|{_labels(labels)}|"
+    with _lock:
+        for field, n in ((prefix + str(bucket), 1), (prefix + "count", 1), (prefix + "sum", seconds)):
+            _buffer[field] = _buffer.get(field, 0) + n
+    if time.monotonic() - _last_flush[0] >= METRICS_FLUSH_INTERVAL:
+        flush()
+
+
+@contextmanager
+def timer(name, **labels):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - started, **labels)
+
+
+def flush():
+    with _lock:
+        pending = dict(_buffer)
+        _buffer.clear()
+        _last_flush[0] = time.monotonic()
+    if not pending:
+        return
+    try:
+        pipe = redis.pipeline(transaction=False)
+        for field, n in pending.items():
+            if field.endswith("|sum"):
+                pipe.hincrbyfloat(METRICS_KEY, field, n)
+            else:
+                pipe.hincrby(METRICS_KEY, field, n)
+        pipe.execute()
+    except Exception as e:
+        # metrics must never fail an import or a request
+        print("Metrics flush failed:", e)
+
+
+def render():
+    """
+    Every histogram in the Prometheus text exposition format
+    """
+    series = {}
+    for field, value in redis.hgetall(METRICS_KEY).items():
+        name, labels, le = field.rsplit("|", 2)
+        series.setdefault(name, {}).setdefault(labels, {})[le] = float(value)
+
+    lines = []
+    for name in sorted(series):
+        lines.append(f"# HELP {name} {HELP.get(name, name)}")
+        lines.append(f"# TYPE {name} histogram")
+        for labels, values in sorted(series[name].items()):
+            sep = "," if labels else ""
+            # stored per bucket, exposed cumulatively
+            cumulative = 0
+            for le in BUCKETS:
+                cumulative += values.get(str(le), 0)
+                lines.append(f'{name}_bucket{{{labels}{sep}le="{le}"}} {int(cumulative)}')
+            lines.append(f'{name}_bucket{{{labels}{sep}le="+Inf"}} {int(values.get("count", 0))}')
+            lines.append(f"{name}_sum{{{labels}}} {values.get('sum', 0)}")
+            lines.append(f"{name}_count{{{labels}}} {int(values.get('count', 0))}")
+    return "\n".join(lines) + "\n"
+
+
+class StageTimer:
+    """
+    Times the stages of one import task. Every measurement goes to the
+    import_stage_seconds histogram; per-stage totals are also handed out as
+    integer millisecond deltas (`drain`) for the job's progress hash, where
+    they add up across batches, shards and resumed runs.
+    """
+
+    def __init__(self, mode):
+        self.mode = mode
+        self.totals = {}
+        self.reported = {}
+
+    def add(self, stage, seconds):
+        self.totals[stage] = self.totals.get(stage, 0) + seconds
+        observe("import_stage_seconds", seconds, stage=stage, mode=self.mode)
+
+    @contextmanager
+    def time(self, stage):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(stage, time.perf_counter() - started)
+
+    def iter(self, stage, iterable):
+        """
+        Iterate over `iterable`, timing each step as `stage`
+        """
+        it = iter(iterable)
+        while True:
+            started = time.perf_counter()
+            try:
+                item = next(it)
+            except StopIteration:
+                self.add(stage, time.perf_counter() - started)
+                return
+            self.add(stage, time.perf_counter() - started)
+            yield item
+
+    def drain(self):
+        """
+        {"stage_<name>_ms": ms} accrued since the last call, for ProgressReporter.incr
+        """
+        deltas = {}
+        for stage, seconds in self.totals.items():
+            ms = int(seconds * 1000)
+            delta = ms - self.reported.get(stage, 0)
+            if delta:
+                deltas[f"stage_{stage}_ms"] = delta
+                self.reported[stage] = ms
+        return deltas
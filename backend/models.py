@@ -1,8 +1,16 @@
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, func, Index
+from sqlalchemy import Column, Integer, BigInteger, String, Boolean, DateTime, func, Index, DDL, event
 from db import Base
 
+# trigram opclasses for the search indexes below
+event.listen(Base.metadata, "before_create", DDL("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+
 class Product(Base):
     __tablename__ = "products"
+    # GIN trigram indexes let the ILIKE '%term%' searches of GET /products use an index
+    __table_args__ = tuple(
+        Index(f"ix_products_{col}_trgm", col, postgresql_using="gin", postgresql_ops={col: "gin_trgm_ops"})
+        for col in ("sku", "name", "description")
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String, nullable=False)
@@ -11,3 +19,53 @@ class Product(Base):
     active = Column(Boolean, default=True)
     created_at = Column(DateTime, server_default=func.now())
     updated_at = Column(DateTime, server_default=func.now(), onupdate=func.now())
+
+
+# Rows staged by parallel import shards until the job's finalizer merges them
+# into products. UNLOGGED: it is scratch data, so skip the WAL.
+class ImportRow(Base):
+    __tablename__ = "import_rows"
+    __table_args__ = (
+        Index("ix_import_rows_job_sku_row", "job_id", "sku", "row_num"),
+        {"prefixes": ["UNLOGGED"]},
+    )
+
+    id = Column(BigInteger, primary_key=True)
+    job_id = Column(String, nullable=False)
+    row_num = Column(BigInteger, nullable=False)
+    name = Column(String, nullable=False)
+    sku = Column(String, nullable=False)
+    description = Column(String)
+    active = Column(Boolean, default=True)
+
+
+# SKUs seen by a snapshot import, for deactivating the products missing from
+# the feed once it completes. UNLOGGED scratch data like import_rows.
+class ImportSku(Base):
+    __tablename__ = "import_skus"
+    __table_args__ = (
+        Index("ix_import_skus_job_sku", "job_id", "sku"),
+        {"prefixes": ["UNLOGGED"]},
+    )
+
+    id = Column(BigInteger, primary_key=True)
+    job_id = Column(String, nullable=False)
+    sku = Column(String, nullable=False)
+
+
+def product_filters(params):
+    """
+    WHERE conditions for the product filters shared by GET /products, the
+    export and filtered bulk deletes: sku/name/description substring
+    matches (trigram indexed) and active=true|false.
+    """
+    conditions = []
+    if params.get("sku"):
+        conditions.append(Product.sku.ilike(f"%{params['sku']}%"))
+    if params.get("name"):
+        conditions.append(Product.name.ilike(f"%{params['name']}%"))
+    if params.get("description"):
+        conditions.append(Product.description.ilike(f"%{params['description']}%"))
+    if params.get("active") in ["true", "false"]:
+        conditions.append(Product.active == (params["active"] == "true"))
+    return conditions
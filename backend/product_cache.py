@@ -0,0 +1,119 @@
+import time
+import json
+import hashlib
+from progress import redis
+from config import PRODUCTS_CACHE_TTL, PRODUCTS_CACHE_MAX_ENTRIES, PRODUCTS_CACHE_MAX_BYTES
+
+# Read-through cache of GET /products responses. Entries are keyed by the
+# normalized query and the catalog version; every write to products bumps
+# the version, which makes all older entries unreachable at once. They are
+# then dropped by their TTL or by the size bound, oldest first.
+VERSION_KEY = "catalog:version"
+ENTRY_PREFIX = "products_cache:"
+# entry keys scored by insertion time, for evicting the oldest
+INDEX_KEY = "products_cache:index"
+STATS_KEY = "products_cache:stats"
+
+# one round trip for a lookup: read the version, then the entry under it
+_LOOKUP = redis.register_script("""
+local version = redis.call('GET', KEYS[1]) or '0'
+local key = ARGV[1] .. version .. ':' .. ARGV[2]
+local body = redis.call('GET', key)
+if body then
+    redis.call('HINCRBY', KEYS[2], 'hits', 1)
+end
+return {version, body}
+""")
+
+
+def bump_catalog_version():
+    """
+    Call after committing any change to products. Returns the new version
+    (None if Redis could not be reached).
+    """
+    try:
+        return redis.incr(VERSION_KEY)
+    except Exception as e:
+        # a stale listing for up to PRODUCTS_CACHE_TTL beats a failed write
+        print("Catalog version bump failed:", e)
+        return None
+
+
+def catalog_version():
+    return int(redis.get(VERSION_KEY) or 0)
+
+
+class VersionChain:
+    """
+    Follows the catalog version through one import's own bumps. `intact`
+    stays True only while every bump lands right after the previous one,
+    i.e. nothing else wrote to products in between. feeds relies on this to
+    know its fingerprints still describe the table.
+    """
+
+    def __init__(self, version, intact=True):
+        self.version = version
+        self.intact = intact and version is not None
+
+    def bump(self):
+        new = bump_catalog_version()
+        if new is None or self.version is None or new != self.version + 1:
+            self.intact = False
+        self.version = new
+
+
+def _digest(params):
+    return hashlib.sha1(json.dumps(params, sort_keys=True).encode()).hexdigest()
+
+
+def lookup(params):
+    """
+    (version, body): the cached json body for params, or None on a miss.
+    (None, None) if the cache is off or Redis could not be reached: the
+    caller then serves from the database and stores nothing.
+    """
+    if not PRODUCTS_CACHE_TTL:
+        return None, None
+    try:
+        version, body = _LOOKUP(keys=[VERSION_KEY, STATS_KEY], args=[ENTRY_PREFIX, _digest(params)])
+    except Exception as e:
+        # listings only need Postgres; the cache is a bonus
+        print("Products cache lookup failed:", e)
+        return None, None
+    return version, body
+
+
+def store(version, params, body):
+    if not PRODUCTS_CACHE_TTL:
+        return
+    key = f"{ENTRY_PREFIX}{version}:{_digest(params)}"
+    try:
+        pipe = redis.pipeline(transaction=False)
+        pipe.hincrby(STATS_KEY, "misses", 1)
+        if len(body) <= PRODUCTS_CACHE_MAX_BYTES:
+            pipe.set(key, body, ex=PRODUCTS_CACHE_TTL)
+            pipe.zadd(INDEX_KEY, {key: time.time()})
+        pipe.zcard(INDEX_KEY)
+        size = pipe.execute()[-1]
+
+        if size > PRODUCTS_CACHE_MAX_ENTRIES:
+            # over the bound: drop the oldest entries (expired ones are just index entries)
+            oldest = [k for k, _ in redis.zpopmin(INDEX_KEY, size - PRODUCTS_CACHE_MAX_ENTRIES)]
+            if oldest:
+                redis.delete(*oldest)
+    except Exception as e:
+        # the response is already built from the database
+        print("Products cache store failed:", e)
+
+
+def stats():
+    hits, misses = (int(n or 0) for n in redis.hmget(STATS_KEY, "hits", "misses"))
+    return {
+        "version": int(redis.get(VERSION_KEY) or 0),
+        "entries": redis.zcard(INDEX_KEY),
+        "hits": hits,
+        "misses": misses,
+        "hit_rate": round(hits / (hits + misses), 4) if hits + misses else None,
+        "ttl_seconds": PRODUCTS_CACHE_TTL,
+        "max_entries": PRODUCTS_CACHE_MAX_ENTRIES,
+    }
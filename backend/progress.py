@@ -0,0 +1,94 @@
+import json
+import time
+from redis import Redis
+from config import REDIS_URL, PROGRESS_FLUSH_INTERVAL, PROGRESS_FLUSH_ROWS
+
+# Redis client (for progress)
+redis = Redis.from_url(REDIS_URL, decode_responses=True)
+
+def redis_key(job_id):
+    return f"progress:{job_id}"
+
+# pub/sub channel carrying every progress write of a job, for GET /progress/stream
+def progress_channel(job_id):
+    return f"progress_updates:{job_id}"
+
+def set_progress(job_id, **kwargs):
+    key = redis_key(job_id)
+    # add updated_at automatically
+    if "updated_at" not in kwargs:
+        kwargs["updated_at"] = str(int(time.time()))
+    pipe = redis.pipeline()
+    pipe.hset(key, mapping=kwargs)
+    pipe.publish(progress_channel(job_id), json.dumps({"set": kwargs}))
+    pipe.execute()
+
+def get_progress(job_id):
+    data = redis.hgetall(redis_key(job_id))
+    return data
+
+
+class ProgressReporter:
+    """
+    Buffers progress for one job and writes it to the progress hash in a
+    single MULTI/EXEC, at most every `interval` seconds or `rows` rows.
+    A status change is written immediately. Each flush also publishes the
+    delta on the job's progress channel.
+
+    Cursor fields written through a reporter may lag the last committed
+    batch by up to one flush; a resumed job then replays those batches,
+    which the idempotent upsert makes harmless.
+
+    Every flush also reads back the job's `control` field (a pending pause
+    or cancel request, see POST /task/<id>/pause) into `self.control`.
+    """
+
+    def __init__(self, job_id, interval=PROGRESS_FLUSH_INTERVAL, rows=PROGRESS_FLUSH_ROWS):
+        self.job_id = job_id
+        self.key = redis_key(job_id)
+        self.interval = interval
+        self.rows = rows
+        self.status = None
+        self.fields = {}
+        self.counts = {}
+        self.pending_rows = 0
+        self.last_flush = time.monotonic()
+        self.control = None
+
+    def set(self, **fields):
+        self.fields.update({k: str(v) for k, v in fields.items()})
+        status = fields.get("status")
+        if status is not None and status != self.status:
+            self.status = status
+            self.flush()
+
+    def incr(self, counts):
+        for field, n in counts.items():
+            if n:
+                self.counts[field] = self.counts.get(field, 0) + n
+
+    def advance(self, rows, counts=None, **fields):
+        """
+        Record a committed batch of `rows` rows and flush if one is due
+        """
+        self.incr(counts or {})
+        self.set(**fields)
+        self.pending_rows += rows
+        if self.pending_rows >= self.rows or time.monotonic() - self.last_flush >= self.interval:
+            self.flush()
+
+    def flush(self):
+        if not self.fields and not self.counts:
+            return
+        self.fields.setdefault("updated_at", str(int(time.time())))
+        pipe = redis.pipeline(transaction=True)
+        for field, n in self.counts.items():
+            pipe.hincrby(self.key, field, n)
+        pipe.hset(self.key, mapping=self.fields)
+        pipe.publish(progress_channel(self.job_id), json.dumps({"set": self.fields, "incr": self.counts}))
+        pipe.hget(self.key, "control")
+        self.control = pipe.execute()[-1] or None
+        self.fields = {}
+        self.counts = {}
+        self.pending_rows = 0
+        self.last_flush = time.monotonic()
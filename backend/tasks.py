@@ -1,197 +1,809 @@
 import os
+import io
 import csv
+import json
 import uuid
-import tempfile
-import shutil
 import time
-from celery import Celery
-from redis import Redis
+import psycopg2
+from functools import partial
+from celery import chord, group
+from sqlalchemy import text, or_, func, literal_column, select, delete
 from sqlalchemy.dialects.postgresql import insert
-from config import REDIS_URL, CHUNK_SIZE, UPLOAD_FOLDER, DATABASE_URL
+from sqlalchemy.exc import DataError, IntegrityError
+from config import REDIS_URL, CHUNK_SIZE, COPY_CHUNK_SIZE, SHARD_SIZE_BYTES, UPLOAD_FOLDER, DATABASE_URL, JOB_TTL_SECONDS
+from config import DELETE_BATCH_SIZE, IMPORT_PARSER, COLUMNAR_BLOCK_SIZE, IMPORT_HEAVY_BYTES
+from config import IMPORT_FAST_BYTES, IMPORT_SLICE_SECONDS
 from db import SessionLocal, engine
-from models import Product
+from models import Product, product_filters
+from celery_app import celery_app
 from webhooks import trigger_event
+from csv_stream import iter_csv_batches, plan_shards, compression
+from progress import redis, redis_key, set_progress, get_progress, ProgressReporter
+import metrics
+from metrics import StageTimer
+from import_errors import errors_key, row_error, record_errors
+import columnar
+from product_cache import bump_catalog_version, catalog_version, VersionChain
+import feeds
+from columnar import ColumnBatch, iter_column_batches, prepare_columns
 
-# Celery
-celery_app = Celery("tasks", broker=REDIS_URL, backend=REDIS_URL)
-celery_app.conf.task_soft_time_limit = 1800  # 30m task soft limit; tune as needed
+# Columnar parsing for serial imports; both settings are fixed for the process
+USE_COLUMNAR = IMPORT_PARSER == "arrow" and columnar.available()
+if IMPORT_PARSER == "arrow" and not USE_COLUMNAR:
+    print("IMPORT_PARSER=arrow but pyarrow is not installed, parsing row by row")
 
-# Redis client (for progress)
-redis = Redis.from_url(REDIS_URL, decode_responses=True)
+# Per-job counters kept in the progress hash
+COUNT_FIELDS = ("inserted", "updated", "unchanged", "duplicates", "errors", "deactivated")
 
-def redis_key(job_id):
-    return f"progress:{job_id}"
+# Last occurrence of a sku wins, like it would across separate statements.
+# Postgres refuses to touch the same row twice in one INSERT ... ON CONFLICT.
+def dedupe_rows(rows):
+    by_sku = {}
+    for r in rows:
+        by_sku.pop(r["sku"], None)
+        by_sku[r["sku"]] = r
+    return list(by_sku.values())
 
-def set_progress(job_id, **kwargs):
-    key = redis_key(job_id)
-    # add updated_at automatically
-    if "updated_at" not in kwargs:
-        kwargs["updated_at"] = str(int(time.time()))
-    redis.hset(key, mapping=kwargs)
-
-def update_progress_inc(job_id, field, n=1):
-    redis.hincrby(redis_key(job_id), field, n)
-    # update timestamp
-    redis.hset(redis_key(job_id), "updated_at", str(int(time.time())))
-
-def get_progress(job_id):
-    data = redis.hgetall(redis_key(job_id))
-    return data
-
-# Helper: remove first n data rows (not header)
-def remove_first_n_rows(filepath, n):
-    # Read header + remainder, write remainder (skipping first n data rows)
-    tmp_fd, tmp_path = tempfile.mkstemp(suffix=".csv")
-    os.close(tmp_fd)
-    try:
-        with open(filepath, newline="", encoding="utf-8") as src, open(tmp_path, "w", newline="", encoding="utf-8") as out:
-            reader = csv.reader(src)
-            writer = csv.writer(out)
-            try:
-                header = next(reader)
-            except StopIteration:
-                # empty file
-                return
-            writer.writerow(header)
-            skipped = 0
-            for row in reader:
-                if skipped < n:
-                    skipped += 1
-                    continue
-                writer.writerow(row)
-        # replace original
-        shutil.move(tmp_path, filepath)
-    finally:
-        if os.path.exists(tmp_path):
-            os.remove(tmp_path)
+# INSERT ... ON CONFLICT (sku) DO UPDATE for rows with distinct skus.
+# Returns (sku, inserted) for every row written; unchanged rows are skipped.
+def upsert_statement(rows):
+    products_table = Product.__table__
+    stmt = insert(products_table).values(rows)
+    update_cols = {c.name: getattr(stmt.excluded, c.name) for c in products_table.c if c.name not in ("id", "created_at", "updated_at")}
+    update_cols["updated_at"] = func.now()
+    # skip rows whose content did not change: no new tuple, no WAL, no index churn
+    changed = or_(*(
+        products_table.c[col].is_distinct_from(getattr(stmt.excluded, col))
+        for col in ("name", "description", "active")
+    ))
+    stmt = stmt.on_conflict_do_update(index_elements=["sku"], set_=update_cols, where=changed)
+    # xmax is 0 for freshly inserted tuples
+    return stmt.returning(products_table.c.sku, literal_column("xmax = 0").label("inserted"))
 
 # Upsert function using SQLAlchemy Core insert...on_conflict
 def upsert_products(session, rows):
     """
-    rows: list of dicts with keys: name, sku, description, active
+    rows: list of dicts with keys: name, sku, description, active,
+          or a ColumnBatch (already deduplicated)
+    returns counts: inserted, updated, unchanged, duplicates
     """
-    products_table = Product.__table__
-    stmt = insert(products_table).values(rows)
-    update_cols = {c.name: getattr(stmt.excluded, c.name) for c in products_table.c if c.name not in ("id", "created_at")}
-    stmt = stmt.on_conflict_do_update(index_elements=["sku"], set_=update_cols)
-    session.execute(stmt)
+    if isinstance(rows, ColumnBatch):
+        unique, duplicates = rows.records(), rows.duplicates
+    else:
+        unique = [{k: v for k, v in r.items() if k != "row_num"} for r in dedupe_rows(rows)]
+        duplicates = len(rows) - len(unique)
+    returned = session.execute(upsert_statement(unique)).fetchall()
+    return merge_counts(returned, len(unique), duplicates)
 
-@celery_app.task(bind=True)
-def process_csv_job(self, job_id, filename):
+def merge_counts(returned, distinct, duplicates):
+    inserted = sum(1 for r in returned if r.inserted)
+    return {
+        "inserted": inserted,
+        "updated": len(returned) - inserted,
+        "unchanged": distinct - len(returned),
+        "duplicates": duplicates,
+    }
+
+# Import modes selectable per job from /upload; "snapshot" is a COPY import of
+# the full catalog that also deactivates every product missing from the file
+IMPORT_MODES = ("upsert", "copy", "parallel", "snapshot")
+
+# Set-based merge of staged rows into products. DISTINCT ON keeps the last
+# occurrence (highest row_num) of every sku, same as a sequential import.
+MERGE_SQL = (
+    "INSERT INTO products (name, sku, description, active) "
+    "SELECT DISTINCT ON (sku) name, sku, description, active "
+    "FROM {source} {where} ORDER BY sku, row_num DESC "
+    "ON CONFLICT (sku) DO UPDATE SET "
+    "name = EXCLUDED.name, description = EXCLUDED.description, "
+    "active = EXCLUDED.active, updated_at = now() "
+    "WHERE (products.name, products.description, products.active) "
+    "IS DISTINCT FROM (EXCLUDED.name, EXCLUDED.description, EXCLUDED.active) "
+    "RETURNING (xmax = 0) AS inserted"
+)
+
+def copy_records(conn, target, records):
+    """
+    Stream records (sequences of column values) into `target`, e.g.
+    "import_rows (job_id, row_num, name)", with COPY FROM STDIN.
+    """
+    buf = io.StringIO()
+    # quote every string so empty descriptions stay '' instead of becoming NULL
+    writer = csv.writer(buf, quoting=csv.QUOTE_NONNUMERIC)
+    writer.writerows(records)
+    buf.seek(0)
+
+    cursor = conn.connection.cursor()
+    try:
+        cursor.copy_expert(f"COPY {target} FROM STDIN WITH (FORMAT csv)", buf)
+    finally:
+        cursor.close()
+
+# Bulk upsert: COPY the batch into a temp staging table, then merge it into
+# products with one set-based INSERT ... SELECT ... ON CONFLICT
+def copy_upsert_products(session, rows):
+    """
+    rows: list of dicts with keys: name, sku, description, active,
+          or a ColumnBatch (already deduplicated)
+    returns counts: inserted, updated, unchanged, duplicates
+    """
+    if isinstance(rows, ColumnBatch):
+        unique, duplicates = rows, rows.duplicates
+        records = rows.copy_records()
+    else:
+        unique = dedupe_rows(rows)
+        duplicates = len(rows) - len(unique)
+        records = (
+            (i, r["name"], r["sku"], r["description"], "true" if r["active"] else "false")
+            for i, r in enumerate(unique)
+        )
+    conn = session.connection()
+    # temp tables are per connection; ON COMMIT DELETE ROWS empties it after every batch
+    conn.exec_driver_sql(
+        "CREATE TEMP TABLE IF NOT EXISTS import_staging ("
+        "row_num bigint, name text, sku text, description text, active boolean"
+        ") ON COMMIT DELETE ROWS"
+    )
+    copy_records(conn, "import_staging (row_num, name, sku, description, active)", records)
+    returned = conn.exec_driver_sql(MERGE_SQL.format(source="import_staging", where="")).fetchall()
+    return merge_counts(returned, len(unique), duplicates)
+
+# Validate raw csv rows; first_row is the number of data rows before this chunk
+def prepare_rows(rows_chunk, first_row, with_row_num=False):
+    prepared = []
+    errors = []
+    for idx, r in enumerate(rows_chunk, start=1):
+        name = (r.get("name") or "").strip()
+        sku = (r.get("sku") or "").strip()
+        description = (r.get("description") or "").strip()
+        if not sku or not name:
+            errors.append(row_error(r, "missing name or sku", first_row + idx))
+            continue
+        if "\x00" in name + sku + description:
+            # postgres text cannot store NUL
+            errors.append(row_error(r, "contains a NUL character", first_row + idx))
+            continue
+        row = {
+            "name": name,
+            "sku": sku,
+            "description": description,
+            "active": True
+        }
+        if with_row_num:
+            row["row_num"] = first_row + idx
+        prepared.append(row)
+    return prepared, errors
+
+# Delta imports: drop the rows whose content matches what the feed last
+# imported. Returns (rows left to write, counts for the dropped rows,
+# fingerprints to save once the rest is committed).
+def changed_since_feed(feed, prepared):
+    if isinstance(prepared, ColumnBatch):
+        keep, fps = feeds.changed_rows(feed, prepared.skus, prepared.names, prepared.descriptions)
+        return prepared.take(keep), {"unchanged": len(prepared) - len(keep), "duplicates": prepared.duplicates}, fps
+    # duplicates are resolved first, so only the surviving row is compared
+    unique = dedupe_rows(prepared)
+    keep, fps = feeds.changed_rows(feed, [r["sku"] for r in unique],
+                                   [r["name"] for r in unique], [r["description"] for r in unique])
+    counts = {"unchanged": len(unique) - len(keep), "duplicates": len(prepared) - len(unique)}
+    return [unique[i] for i in keep], counts, fps
+
+def fingerprints_of(prepared):
+    if isinstance(prepared, ColumnBatch):
+        return {s: feeds.fingerprint(n, d) for n, s, d in zip(prepared.names, prepared.skus, prepared.descriptions)}
+    # later rows overwrite earlier ones, as the upsert does
+    return {r["sku"]: feeds.fingerprint(r["name"], r["description"]) for r in prepared}
+
+# Database errors caused by a row's data rather than by the connection or
+# server; a batch failing with one of these is bisected instead of failing the job.
+# (COPY goes through the raw psycopg2 cursor, so its errors arrive unwrapped.)
+ROW_ERRORS = (DataError, IntegrityError, psycopg2.DataError, psycopg2.IntegrityError)
+
+def db_error_reason(e):
+    # the driver message without the SQL and parameters SQLAlchemy appends
+    return "rejected by database: " + str(getattr(e, "orig", e)).strip().splitlines()[0]
+
+def isolate_bad_rows(session, write, rows, rejected):
+    """
+    Called after write(session, rows) failed with a ROW_ERRORS error: writes
+    and commits each half on its own, splitting failing halves further until
+    the offending rows are alone. Those are appended to `rejected`; all other
+    rows still commit, in order, so last-row-wins holds. Returns merged counts.
+    """
+    counts = {}
+    mid = len(rows) // 2
+    for half in (rows[:mid], rows[mid:]):
+        if not half:
+            continue
+        try:
+            result = write(session, half)
+            session.commit()
+        except ROW_ERRORS as e:
+            session.rollback()
+            if len(half) == 1:
+                rejected.append(row_error(half[0], db_error_reason(e)))
+                continue
+            result = isolate_bad_rows(session, write, half, rejected)
+        for field, n in result.items():
+            counts[field] = counts.get(field, 0) + n
+    return counts
+
+# Snapshot mode: remember the skus of a batch. Committed on its own, after
+# the batch, so a replayed batch just records them twice.
+def record_seen_skus(session, job_id, skus):
+    copy_records(session.connection(), "import_skus (job_id, sku)", ((job_id, sku) for sku in skus))
+    session.commit()
+
+# Snapshot mode: set active = false on every active product whose sku the job
+# did not see. One anti-join UPDATE per DELETE_BATCH_SIZE rows, walking ids in
+# order; deactivated_upto lets a retried job carry on where it stopped.
+DEACTIVATE_SQL = (
+    "UPDATE products SET active = false, updated_at = now() WHERE id IN ("
+    "SELECT p.id FROM products p WHERE p.active AND p.id > :after "
+    "AND NOT EXISTS (SELECT 1 FROM import_skus s WHERE s.job_id = :job AND s.sku = p.sku) "
+    "ORDER BY p.id LIMIT :n) RETURNING id, sku"
+)
+
+def deactivate_missing(session, job_id, reporter, after=0, bump=bump_catalog_version, feed=None):
+    """
+    Returns the pending pause/cancel request if one stopped it between
+    batches (import_skus is then kept for the resumed job), else None.
+    """
+    # an empty or fully rejected feed would switch off the whole catalog
+    if session.execute(text("SELECT 1 FROM import_skus WHERE job_id = :job LIMIT 1"), {"job": job_id}).first() is None:
+        reporter.set(last_message="snapshot had no valid rows, nothing deactivated")
+        return
+    reporter.set(status="deactivating", last_message="deactivating products missing from the snapshot")
+    while True:
+        rows = session.execute(text(DEACTIVATE_SQL), {"job": job_id, "after": after, "n": DELETE_BATCH_SIZE}).all()
+        session.commit()
+        if not rows:
+            break
+        after = max(r.id for r in rows)
+        bump()
+        if feed:
+            # a deactivated row no longer matches its fingerprint
+            feeds.forget_skus(feed, [r.sku for r in rows])
+        reporter.advance(0, {"deactivated": len(rows)}, deactivated_upto=after)
+        if reporter.control:
+            reporter.flush()
+            return reporter.control
+    session.execute(text("DELETE FROM import_skus WHERE job_id = :job"), {"job": job_id})
+    session.commit()
+    reporter.flush()
+    return None
+
+# Extrapolate the row count of the whole file from the rows seen so far
+def estimate_total(rows, bytes_read, bytes_total):
+    if bytes_read <= 0:
+        return rows
+    return max(rows, round(rows * bytes_total / bytes_read))
+
+# Mark a job complete, remove its upload and fire csv.completed
+def finish_job(job_id, filename, processed, total):
     filepath = os.path.join(UPLOAD_FOLDER, filename)
-    # initialize progress
+    # delete file
+    last_message = "Import complete, file deleted"
+    try:
+        if os.path.exists(filepath):
+            os.remove(filepath)
+    except Exception:
+        # non-fatal
+        last_message = "import complete, failed to delete file"
     set_progress(job_id,
-                 status="queued",
-                 filename=filename,
-                 processed="0",
-                 total="0",
-                 last_message="queued",
+                 status="complete",
+                 processed=str(processed),
+                 total=str(total),
+                 last_message=last_message,
                  error="")
+    if JOB_TTL_SECONDS:
+        # /scheduled-tasks drops ids whose hash has expired
+        redis.expire(redis_key(job_id), JOB_TTL_SECONDS)
+        redis.expire(errors_key(job_id), JOB_TTL_SECONDS)
+
+    counts = dict(zip(COUNT_FIELDS, redis.hmget(redis_key(job_id), *COUNT_FIELDS)))
+    trigger_event("csv.completed", {
+        "job_id": job_id,
+        "filename": filename,
+        "processed": processed,
+        "total": total,
+        **{field: int(n or 0) for field, n in counts.items()}
+    })
+
+# Pause / cancel (POST /task/<id>/pause|cancel) set the job's `control`
+# field; workers see it at their next progress flush and stop between
+# batches, after the batch is committed and the cursor is stored. Resuming
+# re-enqueues the job, which carries on from that cursor like a retry.
+class ImportStopped(Exception):
+    """
+    Raised by a parallel shard that stopped for a pause or cancel, so the
+    chord does not go on to merge an incomplete job
+    """
 
-    trigger_event("csv.started", {"job_id": job_id, "filename": filename})
+
+def stop_job(job_id, filename, control):
+    # acts on a request once, if redelivered tasks race
+    if not redis.hsetnx(redis_key(job_id), "stopped", control):
+        return
+    if control == "cancel":
+        cancel_job(job_id, filename)
+        return
+    progress = get_progress(job_id)
+    set_progress(job_id, status="paused", last_message=f"paused after row {progress.get('processed') or 0}")
+    trigger_event("csv.paused", {"job_id": job_id, "filename": filename, "processed": int(progress.get("processed") or 0)})
+
+
+# Give up on a job: rows committed so far stay, its upload and staging rows go
+def cancel_job(job_id, filename):
+    filepath = os.path.join(UPLOAD_FOLDER, filename)
+    try:
+        if os.path.exists(filepath):
+            os.remove(filepath)
+    except Exception:
+        # non-fatal
+        pass
+    db = SessionLocal()
+    try:
+        db.execute(text("DELETE FROM import_rows WHERE job_id = :job"), {"job": job_id})
+        db.execute(text("DELETE FROM import_skus WHERE job_id = :job"), {"job": job_id})
+        db.commit()
+    finally:
+        db.close()
+
+    progress = get_progress(job_id)
+    set_progress(job_id, status="cancelled", last_message="cancelled, rows imported before it are kept", error="")
+    if JOB_TTL_SECONDS:
+        redis.expire(redis_key(job_id), JOB_TTL_SECONDS)
+        redis.expire(errors_key(job_id), JOB_TTL_SECONDS)
+    trigger_event("csv.cancelled", {"job_id": job_id, "filename": filename, "processed": int(progress.get("processed") or 0)})
+
+
+# acks_late + reject_on_worker_lost: if the worker dies mid-import the message is
+# redelivered and the job resumes from the cursor stored in its progress hash.
+#
+# Time slices: after IMPORT_SLICE_SECONDS the job queues a continuation of
+# itself (slice_no + 1) at the back of its queue and returns, so jobs queued
+# behind it get a turn. slice_no is None for the first run, a retry or a
+# resume. A continuation that finds a later slice already started is a
+# redelivered duplicate and exits.
+@celery_app.task(bind=True, acks_late=True, reject_on_worker_lost=True)
+def process_csv_job(self, job_id, filename, slice_no=None):
+    filepath = os.path.join(UPLOAD_FOLDER, filename)
+    slice_started = time.monotonic()
+
+    # resume position of the last committed batch (0/0 for a fresh job)
+    progress = get_progress(job_id)
+    continuation = slice_no is not None
+    if not continuation:
+        slice_no = int(progress.get("slice") or 0)
+    elif int(progress.get("slice") or 0) > slice_no:
+        return {"status": "superseded"}
+    offset = int(progress.get("offset") or 0)
+    row_number = int(progress.get("row_number") or 0)
+    # bytes of the file on disk behind that cursor (differs from offset for compressed uploads)
+    bytes_read = int(progress.get("bytes_read") or 0) if row_number else 0
+    mode = progress.get("mode") or "upsert"
+    # paused or cancelled while still queued
+    if progress.get("control"):
+        stop_job(job_id, filename, progress["control"])
+        return {"status": progress["control"]}
+    # compressed files cannot be sharded, so "parallel" jobs on them run here on the COPY path
+    if mode in ("copy", "parallel", "snapshot"):
+        write_rows, batch_size = copy_upsert_products, COPY_CHUNK_SIZE
+    else:
+        write_rows, batch_size = upsert_products, CHUNK_SIZE
 
     if not os.path.exists(filepath):
         set_progress(job_id, status="failed", last_message="file not found", error="file not found")
+        trigger_event("csv.started", {"job_id": job_id, "filename": filename})
         return {"error": "file not found"}
 
-    # Count total rows (excluding header) for accurate progress
-    try:
-        with open(filepath, newline="", encoding="utf-8") as f:
-            reader = csv.DictReader(f)
-            total = 0
-            for row in reader:
-                name = (row.get("name") or "").strip()
-                sku = (row.get("sku") or "").strip()
-                if name and sku:
-                    total += 1
-    except Exception as e:
-        set_progress(job_id, status="failed", last_message="count failed", error=str(e))
-        return {"error": str(e)}
+    # progress is bytes consumed over file size, so it is known before the first
+    # row is parsed; the row total is estimated from it as the import streams
+    bytes_total = os.path.getsize(filepath)
+
+
+    # per-stage timings: parse, validate, upsert, commit, progress, webhook
+    stages = StageTimer(mode)
+
+    # Delta import against the feed's fingerprints, and this job's own catalog
+    # version bumps: fingerprints and the upload digest are only kept for
+    # later jobs if nothing else wrote to products while this one ran.
+    feed = progress.get("feed") or ""
+    if "chain_version" in progress:
+        # resumed: anything bumped since the last stored batch breaks the chain
+        chain = VersionChain(int(progress["chain_version"]),
+                             progress.get("chain_intact") == "1" and catalog_version() == int(progress["chain_version"]))
+        delta = progress.get("delta") == "1" and chain.intact
+    elif feed:
+        delta, version = feeds.start_delta(feed)
+        chain = VersionChain(version)
+    else:
+        delta, chain = False, VersionChain(catalog_version())
+
+    # initialize progress; a continuation slice keeps the job's start for rate / ETA
+    started = {} if continuation else {"started_at": int(time.time()), "start_bytes": bytes_read, "start_rows": row_number}
+    reporter = ProgressReporter(job_id)
+    reporter.set(status="parsing",
+                 filename=filename,
+                 processed=row_number,
+                 offset=offset,
+                 row_number=row_number,
+                 bytes_read=bytes_read,
+                 bytes_total=bytes_total,
+                 total=progress.get("total") or 0,
+                 slice=slice_no,
+                 **started,
+                 delta=int(delta),
+                 chain_version=chain.version or 0,
+                 chain_intact=int(chain.intact),
+                 last_message="starting parsing" if not row_number else f"resuming after row {row_number}",
+                 error="")
 
-    set_progress(job_id, status="parsing", total=str(total), processed="0", last_message="starting parsing")
+    if not continuation:
+        with stages.time("webhook"):
+            trigger_event("csv.started", {"job_id": job_id, "filename": filename})
 
-    processed = 0
+    processed = row_number
     db = SessionLocal()
     try:
-        while True:
-            # Read next CHUNK_SIZE rows from file (preserve header)
-            rows_chunk = []
-            with open(filepath, newline="", encoding="utf-8") as csvfile:
-                reader = csv.DictReader(csvfile)
-                # read CHUNK_SIZE rows into list
-                for i, row in enumerate(reader):
-                    if i >= CHUNK_SIZE:
-                        break
-                    rows_chunk.append(row)
-
-            if not rows_chunk:
-                # nothing to process
-                break
-
-            set_progress(job_id, status="processing", last_message=f"parsing rows {processed+1}-{processed+len(rows_chunk)}")
+        # single forward-only pass over the file, starting after the last committed batch
+        if USE_COLUMNAR:
+            batches = iter_column_batches(filepath, COLUMNAR_BLOCK_SIZE, batch_size, offset, row_number)
+        else:
+            batches = iter_csv_batches(filepath, batch_size, offset, row_number)
+        for rows_chunk, offset, row_number, bytes_read in stages.iter("parse", batches):
+            with stages.time("progress"):
+                reporter.set(status="processing", last_message=f"parsing rows {processed+1}-{processed+len(rows_chunk)}")
 
             # validate and prepare rows for upsert
-            prepared = []
-            errors = []
-            for idx, r in enumerate(rows_chunk, start=1):
-                name = (r.get("name") or "").strip()
-                sku = (r.get("sku") or "").strip()
-                description = (r.get("description") or "").strip()
-                if not sku or not name:
-                    errors.append({"row_index": processed + idx, "reason": "missing name or sku"})
-                    continue
-                prepared.append({
-                    "name": name,
-                    "sku": sku,
-                    "description": description,
-                    "active": True
-                })
+            with stages.time("validate"):
+                if USE_COLUMNAR:
+                    prepared, errors = prepare_columns(rows_chunk, processed)
+                else:
+                    prepared, errors = prepare_rows(rows_chunk, processed, with_row_num=True)
+
+            # snapshot mode records every valid sku, written or not
+            seen = prepared
+            counts = {}
+            fingerprints = {}
+            if delta and prepared:
+                with stages.time("delta"):
+                    prepared, counts, fingerprints = changed_since_feed(feed, prepared)
+            elif feed and prepared:
+                # full import of a feed: (re)builds its fingerprints
+                with stages.time("delta"):
+                    fingerprints = fingerprints_of(prepared)
 
             if prepared:
                 # upsert
                 try:
-                    upsert_products(db, prepared)
-                    db.commit()
+                    with stages.time("upsert"):
+                        written = write_rows(db, prepared)
+                    with stages.time("commit"):
+                        db.commit()
+                except ROW_ERRORS:
+                    # some row in the batch was refused: find it, commit the rest
+                    db.rollback()
+                    if isinstance(prepared, ColumnBatch):
+                        prepared = prepared.rows()
+                    with stages.time("bisect"):
+                        written = isolate_bad_rows(db, write_rows, prepared, errors)
+                    # which rows made it is not tracked; they are compared again next time
+                    fingerprints = {}
                 except Exception as e:
                     db.rollback()
-                    set_progress(job_id, status="failed", last_message="db error", error=str(e))
+                    reporter.incr(stages.drain())
+                    reporter.set(status="failed", last_message="db error", error=str(e))
                     return {"error": str(e)}
+                for field, n in written.items():
+                    counts[field] = counts.get(field, 0) + n
+
+            if mode == "snapshot" and seen:
+                with stages.time("snapshot"):
+                    record_seen_skus(db, job_id, seen.skus if isinstance(seen, ColumnBatch) else (r["sku"] for r in seen))
+
+            # cached product listings are stale once a batch changed something
+            if counts.get("inserted") or counts.get("updated"):
+                with stages.time("progress"):
+                    chain.bump()
+
+            if feed:
+                with stages.time("delta"):
+                    feeds.save_fingerprints(feed, fingerprints)
+
+            # rejected rows go straight to the job's error stream
+            if errors:
+                with stages.time("progress"):
+                    record_errors(job_id, errors)
+                counts = {**counts, "errors": len(errors)}
+
+            # batch is committed: move the cursor past it. If we crash before the
+            # next flush the batch is replayed on resume, which the upsert makes harmless.
+            processed = row_number
+            with stages.time("progress"):
+                reporter.advance(len(rows_chunk), {**counts, **stages.drain()},
+                                 processed=processed,
+                                 offset=offset,
+                                 row_number=row_number,
+                                 bytes_read=bytes_read,
+                                 chain_version=chain.version or 0,
+                                 chain_intact=int(chain.intact),
+                                 total=estimate_total(processed, bytes_read, bytes_total),
+                                 last_message=f"updated rows {processed - len(rows_chunk)+1}-{processed}")
+
+            # pause / cancel requested: the flush that reported it stored the cursor
+            if reporter.control:
+                reporter.incr(stages.drain())
+                reporter.flush()
+                stop_job(job_id, filename, reporter.control)
+                return {"status": reporter.control, "processed": processed}
+
+            # slice used up: the rest waits behind whatever was queued meanwhile
+            if IMPORT_SLICE_SECONDS and time.monotonic() - slice_started >= IMPORT_SLICE_SECONDS:
+                reporter.incr(stages.drain())
+                reporter.set(status="queued", last_message=f"imported rows up to {processed}, continuing in the next slice")
+                reporter.flush()
+                process_csv_job.apply_async((job_id, filename, slice_no + 1),
+                                            queue=import_queue(filepath, progress.get("priority")))
+                return {"status": "continued", "processed": processed}
+
+        if mode == "snapshot":
+            with stages.time("deactivate"):
+                control = deactivate_missing(db, job_id, reporter, int(progress.get("deactivated_upto") or 0),
+                                             bump=chain.bump, feed=feed)
+            if control:
+                # a resumed job skips past the file and carries on deactivating
+                reporter.incr(stages.drain())
+                reporter.flush()
+                stop_job(job_id, filename, control)
+                return {"status": control, "processed": processed}
+
+        # later uploads of this feed / this exact file can rely on the result
+        if feed:
+            feeds.finish_feed(feed, chain)
+        if progress.get("digest"):
+            feeds.record_digest(mode, feed, progress["digest"], job_id, processed, chain)
+
+        # finished; the row total is exact now
+        reporter.incr(stages.drain())
+        reporter.flush()
+        finish_job(job_id, filename, processed, processed)
+
+        return {"status": "complete", "processed": processed}
+
+    except Exception as e:
+        db.rollback()
+        trigger_event("csv.failed", {
+            "job_id": job_id,
+            "filename": filename,
+            "error": str(e)
+        })
+        reporter.incr(stages.drain())
+        reporter.set(status="failed", last_message="unexpected error", error=str(e))
+        raise
+    finally:
+        db.close()
+        metrics.flush()
+
+
+# Parallel import: a planner splits the file into record-aligned byte ranges,
+# shard tasks stage their rows into import_rows concurrently, and a chord
+# callback merges everything into products once all shards are done.
+@celery_app.task(bind=True, acks_late=True, reject_on_worker_lost=True)
+def plan_csv_job(self, job_id, filename):
+    filepath = os.path.join(UPLOAD_FOLDER, filename)
+    progress = get_progress(job_id)
+
+    if not os.path.exists(filepath):
+        set_progress(job_id, status="failed", last_message="file not found", error="file not found")
+        trigger_event("csv.started", {"job_id": job_id, "filename": filename})
+        return {"error": "file not found"}
+
+    # shards of a paused / retried run start over from their cursors
+    ended = [f"shard_{i}_state" for i in range(int(progress.get("shards") or 0))]
+    redis.hdel(redis_key(job_id), "stopped", *ended)
+
+    if progress.get("control"):
+        stop_job(job_id, filename, progress["control"])
+        return {"status": progress["control"]}
+
+    set_progress(job_id,
+                 status="queued",
+                 filename=filename,
+                 bytes_total=str(os.path.getsize(filepath)),
+                 started_at=str(int(time.time())),
+                 start_bytes=progress.get("bytes_read") or "0",
+                 start_rows=progress.get("processed") or "0",
+                 last_message="planning shards",
+                 error="")
 
-            # update counts
-            processed += len(rows_chunk)
-            update_progress_inc(job_id, "processed", len(rows_chunk))
-            # record last message for UI
-            set_progress(job_id, last_message=f"updated rows {processed - len(rows_chunk)+1}-{processed}")
-
-            # Remove first N rows (N = len(rows_chunk)) from file
-            try:
-                remove_first_n_rows(filepath, len(rows_chunk))
-            except Exception as e:
-                # if file rewrite fails, mark failed
-                set_progress(job_id, status="failed", last_message="file rewrite failed", error=str(e))
-                return {"error": str(e)}
-
-            # continue loop until file empty
-        # finished
-        set_progress(job_id, status="complete", last_message="Import complete", error="")
-        # delete file
+    trigger_event("csv.started", {"job_id": job_id, "filename": filename})
+
+    # a retried job keeps its plan; shards resume from their own cursors
+    if progress.get("shard_plan"):
+        shards = json.loads(progress["shard_plan"])
+        total = int(progress.get("total") or 0)
+    else:
         try:
-            if os.path.exists(filepath):
-                os.remove(filepath)
-            set_progress(job_id, last_message="file deleted")
-        except Exception:
-            # non-fatal
-            set_progress(job_id, last_message="import complete, failed to delete file")
-
-        trigger_event("csv.completed", {
+            shards, total = plan_shards(filepath, SHARD_SIZE_BYTES)
+        except Exception as e:
+            set_progress(job_id, status="failed", last_message="planning failed", error=str(e))
+            return {"error": str(e)}
+        # the planning scan already counted the rows, so the total is exact
+        set_progress(job_id,
+                     shard_plan=json.dumps(shards),
+                     shards=str(len(shards)),
+                     total=str(total),
+                     processed="0",
+                     bytes_read="0")
+
+    if not shards:
+        finish_job(job_id, filename, 0, total)
+        return {"status": "complete", "processed": 0}
+
+    set_progress(job_id, status="processing", last_message=f"importing {len(shards)} shards")
+    # shards and the merge stay on the planner's queue
+    queue = import_queue(filepath, progress.get("priority"))
+    header = group(
+        process_csv_shard.s(job_id, filename, i, start, end, first_row).set(queue=queue)
+        for i, (start, end, first_row) in enumerate(shards)
+    )
+    chord(header)(finalize_csv_job.s(job_id, filename).set(queue=queue))
+    return {"shards": len(shards)}
+
+
+# COPY prepared rows of a parallel job into import_rows
+def stage_rows(session, rows, job_id):
+    copy_records(session.connection(), "import_rows (job_id, row_num, name, sku, description, active)", (
+        (job_id, r["row_num"], r["name"], r["sku"], r["description"], "true")
+        for r in rows
+    ))
+    return {}
+
+
+@celery_app.task(bind=True, acks_late=True, reject_on_worker_lost=True)
+def process_csv_shard(self, job_id, filename, shard, start, end, first_row):
+    filepath = os.path.join(UPLOAD_FOLDER, filename)
+    offset_field, row_field = f"shard_{shard}_offset", f"shard_{shard}_row"
+
+    # per-shard cursor of the last staged batch
+    offset, row_number, control = redis.hmget(redis_key(job_id), offset_field, row_field, "control")
+    offset = int(offset or start)
+    row_number = int(row_number or first_row)
+    if control:
+        shard_ended(job_id, filename, shard, stopped=True)
+        raise ImportStopped(f"{control} requested")
+
+    stages = StageTimer("parallel")
+    write_rows = partial(stage_rows, job_id=job_id)
+    reporter = ProgressReporter(job_id)
+    db = SessionLocal()
+    try:
+        prev_offset = offset
+        batches = iter_csv_batches(filepath, COPY_CHUNK_SIZE, offset, row_number, end)
+        for rows_chunk, offset, row_number, _ in stages.iter("parse", batches):
+            with stages.time("validate"):
+                prepared, errors = prepare_rows(rows_chunk, row_number - len(rows_chunk), with_row_num=True)
+            if prepared:
+                try:
+                    with stages.time("stage"):
+                        write_rows(db, prepared)
+                    with stages.time("commit"):
+                        db.commit()
+                except ROW_ERRORS:
+                    db.rollback()
+                    with stages.time("bisect"):
+                        isolate_bad_rows(db, write_rows, prepared, errors)
+            if errors:
+                with stages.time("progress"):
+                    record_errors(job_id, errors)
+
+            with stages.time("progress"):
+                reporter.advance(len(rows_chunk),
+                                 {"processed": len(rows_chunk), "bytes_read": offset - prev_offset,
+                                  "errors": len(errors), **stages.drain()},
+                                 **{offset_field: offset, row_field: row_number})
+            prev_offset = offset
+            if reporter.control:
+                # this shard's cursor is stored; a resumed job carries on from it
+                break
+        reporter.incr(stages.drain())
+        reporter.flush()
+    except Exception as e:
+        db.rollback()
+        reporter.incr(stages.drain())
+        reporter.flush()
+        trigger_event("csv.failed", {
             "job_id": job_id,
             "filename": filename,
-            "processed": processed,
-            "total": total
+            "error": str(e)
         })
+        set_progress(job_id, status="failed", last_message=f"shard {shard} failed", error=str(e))
+        raise
+    finally:
+        db.close()
+        metrics.flush()
 
-        return {"status": "complete", "processed": processed}
+    stopped = reporter.control is not None
+    shard_ended(job_id, filename, shard, stopped)
+    if stopped:
+        raise ImportStopped(f"{reporter.control} requested")
+    return {"shard": shard, "rows": row_number - first_row}
+
+
+# A parallel job stops as a whole: every shard records how it ended, and the
+# one that ends last acts on a pause / cancel, once no shard of the job is
+# still staging rows. Until then the job keeps its running status.
+def shard_ended(job_id, filename, shard, stopped):
+    key = redis_key(job_id)
+    pipe = redis.pipeline(transaction=True)
+    pipe.hset(key, f"shard_{shard}_state", "stopped" if stopped else "done")
+    pipe.hgetall(key)
+    _, progress = pipe.execute()
+    states = [progress.get(f"shard_{i}_state") for i in range(int(progress.get("shards") or 0))]
+    if None in states or "stopped" not in states:
+        # shards still running, or all done and the chord goes on to finalize_csv_job
+        return
+    if progress.get("control"):
+        stop_job(job_id, filename, progress["control"])
+    elif redis.hsetnx(key, "stopped", "requeued"):
+        # the pause was withdrawn after some shards had stopped: start them again
+        set_progress(job_id, status="queued", last_message="pause withdrawn, continuing")
+        enqueue_import(job_id, filename, "parallel", progress.get("priority"))
+
+
+@celery_app.task(bind=True)
+def finalize_csv_job(self, results, job_id, filename):
+    processed = sum(r["rows"] for r in results)
+    progress = get_progress(job_id)
+    # paused or cancelled after the last shard finished
+    if progress.get("control"):
+        stop_job(job_id, filename, progress["control"])
+        return {"status": progress["control"]}
+    total = int(progress.get("total") or 0)
+    stages = StageTimer("parallel")
+    reporter = ProgressReporter(job_id)
+    reporter.set(status="merging", processed=processed, last_message="merging staged rows")
 
+    db = SessionLocal()
+    try:
+        # merge in sku ranges so a single statement never covers the whole job;
+        # every sku lives in exactly one range, so last-row-wins still holds.
+        # merged_upto lets a retried finalizer skip ranges that are already in.
+        after = progress.get("merged_upto") or ""
+        while True:
+            upto, distinct, staged = db.execute(text(
+                "SELECT max(sku), count(*), coalesce(sum(n), 0) FROM ("
+                "SELECT sku, count(*) AS n FROM import_rows "
+                "WHERE job_id = :job AND sku > :after GROUP BY sku ORDER BY sku LIMIT :n) s"
+            ), {"job": job_id, "after": after, "n": COPY_CHUNK_SIZE}).one()
+            if upto is None:
+                break
+            with stages.time("merge"):
+                returned = db.execute(text(MERGE_SQL.format(
+                    source="import_rows",
+                    where="WHERE job_id = :job AND sku > :after AND sku <= :upto"
+                )), {"job": job_id, "after": after, "upto": upto}).fetchall()
+            with stages.time("commit"):
+                db.commit()
+            if returned:
+                bump_catalog_version()
+            reporter.advance(distinct, {**merge_counts(returned, distinct, staged - distinct), **stages.drain()},
+                             merged_upto=upto,
+                             last_message=f"merged skus up to {upto}")
+            after = upto
+            if reporter.control:
+                # merged_upto is flushed; a resumed job replans, its shards
+                # find nothing left to stage and the merge carries on from there
+                break
+        reporter.flush()
+        if reporter.control:
+            stop_job(job_id, filename, reporter.control)
+            return {"status": reporter.control, "processed": processed}
+
+        db.execute(text("DELETE FROM import_rows WHERE job_id = :job"), {"job": job_id})
+        db.commit()
     except Exception as e:
         db.rollback()
         trigger_event("csv.failed", {
@@ -199,7 +811,128 @@ def process_csv_job(self, job_id, filename):
             "filename": filename,
             "error": str(e)
         })
-        set_progress(job_id, status="failed", last_message="unexpected error", error=str(e))
+        reporter.set(status="failed", last_message="merge failed", error=str(e))
+        raise
+    finally:
+        db.close()
+        metrics.flush()
+
+    finish_job(job_id, filename, processed, total)
+    return {"status": "complete", "processed": processed}
+
+
+# Filtered bulk delete (DELETE /products with filters). Deletes in id order,
+# DELETE_BATCH_SIZE rows per transaction, so locks are short-lived and
+# imports keep running alongside it.
+@celery_app.task(bind=True, acks_late=True, reject_on_worker_lost=True)
+def delete_products_job(self, job_id, filters):
+    conditions = product_filters(filters)
+    if filters and not conditions:
+        # filters that match nothing would delete the whole catalog
+        error = f"no valid filter in {json.dumps(filters)}, refusing to delete every product"
+        set_progress(job_id, status="failed", last_message="invalid filters", error=error)
+        return {"error": error}
+    progress = get_progress(job_id)
+    last_id = int(progress.get("last_id") or 0)
+    deleted = int(progress.get("processed") or 0)
+
+    reporter = ProgressReporter(job_id)
+    db = SessionLocal()
+    try:
+        total = deleted + db.execute(
+            select(func.count()).select_from(Product).where(Product.id > last_id, *conditions)
+        ).scalar()
+        reporter.set(status="processing",
+                     total=total,
+                     started_at=int(time.time()),
+                     start_rows=deleted,
+                     last_message="deleting products",
+                     error="")
+
+        while True:
+            batch = select(Product.id).where(Product.id > last_id, *conditions).order_by(Product.id).limit(DELETE_BATCH_SIZE)
+            ids = db.execute(delete(Product).where(Product.id.in_(batch)).returning(Product.id)).scalars().all()
+            db.commit()
+            if not ids:
+                break
+            bump_catalog_version()
+            last_id = max(ids)
+            deleted += len(ids)
+            reporter.advance(len(ids), processed=deleted, last_id=last_id, last_message=f"deleted {deleted} products")
+    except Exception as e:
+        db.rollback()
+        reporter.set(status="failed", last_message="delete failed", error=str(e))
         raise
     finally:
         db.close()
+
+    reporter.set(status="complete", processed=deleted, total=deleted, last_message=f"deleted {deleted} products")
+    if JOB_TTL_SECONDS:
+        redis.expire(redis_key(job_id), JOB_TTL_SECONDS)
+    trigger_event("products.bulk_deleted", {
+        "job_id": job_id,
+        "truncated": False,
+        "deleted": deleted,
+        "filters": filters
+    })
+    return {"status": "complete", "deleted": deleted}
+
+
+# Chunked uploads (POST /uploads): their state lives in Redis with
+# UPLOAD_TTL_SECONDS, their file in UPLOAD_FOLDER. UPLOADS_PENDING scores
+# each unfinished upload's filename by the time it expires unless more
+# chunks arrive; completing an upload removes it.
+UPLOADS_PENDING = "uploads_pending"
+
+def upload_key(upload_id):
+    return f"upload:{upload_id}"
+
+def upload_ranges_key(upload_id):
+    return f"upload_ranges:{upload_id}"
+
+# Delete the files of uploads abandoned before completion (run by celery beat)
+@celery_app.task
+def cleanup_abandoned_uploads():
+    removed = 0
+    for filename in redis.zrangebyscore(UPLOADS_PENDING, "-inf", int(time.time())):
+        upload_id = filename.split("_", 1)[0]
+        if redis.exists(upload_key(upload_id)):
+            # a chunk arrived while we looked; it moved the expiry forward
+            continue
+        # zrem decides between this and a concurrent sweep
+        if not redis.zrem(UPLOADS_PENDING, filename):
+            continue
+        try:
+            os.remove(os.path.join(UPLOAD_FOLDER, filename))
+            removed += 1
+        except FileNotFoundError:
+            pass
+    return {"removed": removed}
+
+# Imports run on one of three queues, each with its own workers, so a
+# multi-GB feed cannot hold every worker while small uploads wait behind it:
+# imports_fast (under IMPORT_FAST_BYTES), celery, and imports_heavy (at
+# least IMPORT_HEAVY_BYTES). The priority of POST /upload overrides the size:
+# "high" always takes the fast lane, "low" the heavy one, "normal" goes by size.
+IMPORT_PRIORITIES = ("high", "normal", "low")
+
+def import_queue(filepath, priority=None):
+    if priority == "high":
+        return "imports_fast"
+    if priority == "low":
+        return "imports_heavy"
+    size = os.path.getsize(filepath) if os.path.exists(filepath) else 0
+    if size >= IMPORT_HEAVY_BYTES:
+        return "imports_heavy"
+    if size < IMPORT_FAST_BYTES:
+        return "imports_fast"
+    return "celery"
+
+def enqueue_import(job_id, filename, mode, priority=None):
+    filepath = os.path.join(UPLOAD_FOLDER, filename)
+    queue = import_queue(filepath, priority)
+    # gzip/zstd streams can only be read front to back: no shards
+    if mode == "parallel" and not (os.path.exists(filepath) and compression(filepath)):
+        plan_csv_job.apply_async((job_id, filename), queue=queue)
+    else:
+        process_csv_job.apply_async((job_id, filename), queue=queue)
@@ -1,51 +1,166 @@
+import os
+import json
 import time
 import requests
+from requests.adapters import HTTPAdapter
 from redis import Redis
 import uuid
 
-from config import REDIS_URL
+from config import (
+    REDIS_URL,
+    WEBHOOK_TIMEOUT,
+    WEBHOOK_MAX_RETRIES,
+    WEBHOOK_BACKOFF_SECONDS,
+    WEBHOOK_MAX_INFLIGHT,
+    WEBHOOK_DEAD_LETTER_MAX,
+    WEBHOOK_REGISTRY_TTL,
+)
+from celery_app import celery_app
+from metrics import timer, observe
 
 redis = Redis.from_url(REDIS_URL, decode_responses=True)
 
 WEBHOOK_SET = "webhook_ids"
+DEAD_LETTER_LIST = "webhook_dead_letters"
+# published on every webhook write so each process drops its cached registry
+REGISTRY_CHANNEL = "webhooks:invalidate"
 
-def get_all_webhooks():
-    ids = redis.smembers(WEBHOOK_SET)
-    hooks = []
+# one keep-alive connection pool per worker process, shared by all deliveries
+http = requests.Session()
+http.mount("http://", HTTPAdapter(pool_connections=32, pool_maxsize=32))
+http.mount("https://", HTTPAdapter(pool_connections=32, pool_maxsize=32))
 
+def get_all_webhooks():
+    ids = list(redis.smembers(WEBHOOK_SET))
+    # fetch every hook hash in one pipelined round trip
+    pipe = redis.pipeline(transaction=False)
     for wid in ids:
-        data = redis.hgetall(f"webhook:{wid}")
+        pipe.hgetall(f"webhook:{wid}")
+
+    hooks = []
+    for wid, data in zip(ids, pipe.execute()):
         if data:
             hooks.append({ "id": wid, **data })
 
     return hooks
 
 
+# In-process webhook registry. Rebuilt lazily after an invalidation message
+# (or after WEBHOOK_REGISTRY_TTL as a safety net in case the listener dropped),
+# so in the steady state looking up subscribers costs no Redis round trips.
+_registry = {"pid": None, "stale": True, "loaded_at": 0, "hooks": [], "by_event": {}}
+
+def _on_invalidate(message):
+    _registry["stale"] = True
+
+def _ensure_listener():
+    # one subscriber thread per process; prefork children start their own
+    if _registry["pid"] == os.getpid():
+        return
+    pubsub = redis.pubsub(ignore_subscribe_messages=True)
+    pubsub.subscribe(**{REGISTRY_CHANNEL: _on_invalidate})
+    pubsub.run_in_thread(sleep_time=1, daemon=True)
+    _registry.update(pid=os.getpid(), stale=True)
+
+def _load_registry():
+    _ensure_listener()
+    if _registry["stale"] or time.time() - _registry["loaded_at"] > WEBHOOK_REGISTRY_TTL:
+        # cleared before loading so an invalidation that races the load is not lost
+        _registry["stale"] = False
+        hooks = get_all_webhooks()
+        by_event = {}
+        for hook in hooks:
+            if hook.get("enabled") != "true":
+                continue
+            for event_name in hook.get("events", "").split(","):
+                if event_name:
+                    by_event.setdefault(event_name, []).append(hook)
+        _registry.update(hooks=hooks, by_event=by_event, loaded_at=time.time())
+    return _registry
+
+def cached_webhooks():
+    return _load_registry()["hooks"]
+
+def hooks_for_event(event_name):
+    """
+    Enabled hooks subscribed to event_name
+    """
+    return _load_registry()["by_event"].get(event_name, [])
+
+def invalidate_registry():
+    """
+    Call after any write to a webhook so every API/worker process reloads
+    """
+    _registry["stale"] = True
+    redis.publish(REGISTRY_CHANNEL, "1")
+
+
 def trigger_event(event_name, payload):
     """
-    Send webhook POST requests for hooks subscribed to event_name
-    """
-    hooks = get_all_webhooks()
-
-    for hook in hooks:
-        if hook.get("enabled") != "true":
-            continue
-
-        events = hook.get("events", "").split(",")
-        if event_name not in events:
-            continue
-
-        # fire webhook async-like (non-blocking)
-        try:
-            requests.post(
-                hook["url"],
-                json={
-                    "event": event_name,
-                    "timestamp": int(time.time()),
-                    **payload
-                },
-                timeout=3
-            )
-        except Exception as e:
-            # Store failure info but do NOT break CSV job
-            print("Webhook failed:", e)
+    Queue event_name for delivery to its subscribers.
+    Costs the caller a single broker push (none if nobody subscribed);
+    HTTP happens on the webhooks queue.
+    """
+    if not hooks_for_event(event_name):
+        return
+
+    body = {
+        "event": event_name,
+        "timestamp": int(time.time()),
+        **payload
+    }
+    try:
+        with timer("webhook_enqueue_seconds", event=event_name):
+            dispatch_event.delay(event_name, body)
+    except Exception as e:
+        # never break an import or request because the broker hiccuped
+        print("Webhook enqueue failed:", e)
+
+
+@celery_app.task
+def dispatch_event(event_name, body):
+    """
+    Fan an event out into one delivery task per subscribed, enabled hook
+    """
+    for hook in hooks_for_event(event_name):
+        deliver_webhook.delay(hook["id"], hook["url"], body)
+
+
+@celery_app.task
+def deliver_webhook(wid, url, body, attempt=0):
+    # bound the number of concurrent deliveries per endpoint
+    inflight_key = f"webhook_inflight:{wid}"
+    inflight = redis.incr(inflight_key)
+    redis.expire(inflight_key, int(WEBHOOK_TIMEOUT) + 60)
+    if inflight > WEBHOOK_MAX_INFLIGHT:
+        redis.decr(inflight_key)
+        # endpoint is saturated: try again shortly without using up an attempt
+        deliver_webhook.apply_async((wid, url, body, attempt), countdown=1)
+        return {"deferred": True}
+
+    started = time.perf_counter()
+    try:
+        r = http.post(url, json=body, timeout=WEBHOOK_TIMEOUT)
+        r.raise_for_status()
+        observe("webhook_delivery_seconds", time.perf_counter() - started, event=body.get("event"), outcome="ok")
+        return {"status": r.status_code}
+    except Exception as e:
+        observe("webhook_delivery_seconds", time.perf_counter() - started, event=body.get("event"), outcome="error")
+        if attempt < WEBHOOK_MAX_RETRIES:
+            # exponential backoff: 2s, 4s, 8s, ...
+            deliver_webhook.apply_async((wid, url, body, attempt + 1),
+                                        countdown=WEBHOOK_BACKOFF_SECONDS * 2 ** attempt)
+            return {"error": str(e), "retrying": True}
+        # out of retries: park it in the dead-letter list
+        redis.lpush(DEAD_LETTER_LIST, json.dumps({
+            "webhook_id": wid,
+            "url": url,
+            "body": body,
+            "error": str(e),
+            "attempts": attempt + 1,
+            "failed_at": int(time.time())
+        }))
+        redis.ltrim(DEAD_LETTER_LIST, 0, WEBHOOK_DEAD_LETTER_MAX - 1)
+        return {"error": str(e)}
+    finally:
+        redis.decr(inflight_key)
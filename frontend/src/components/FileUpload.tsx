@@ -32,7 +32,7 @@ type TaskSummary = {
 const FileUpload = () => {
   const { toast } = useToast();
   const fileInputRef = useRef<HTMLInputElement>(null);
-  const pollRef = useRef<number | null>(null);
+  const streamRef = useRef<EventSource | null>(null);
   const [selectedFile, setSelectedFile] = useState<File | null>(null);
   const [uploading, setUploading] = useState(false);
   const [jobId, setJobId] = useState<string | null>(null);
@@ -46,59 +46,65 @@ const FileUpload = () => {
   });
   const [tasks, setTasks] = useState<TaskSummary[]>([]);
 
-  // helper to clear polling interval
+  // helper to close the progress stream
   const clearPoll = () => {
-    if (pollRef.current) {
-      clearInterval(pollRef.current);
-      pollRef.current = null;
+    if (streamRef.current) {
+      streamRef.current.close();
+      streamRef.current = null;
     }
   };
 
-  // Polling function
+  // Progress stream (server-sent events): first event is a full snapshot,
+  // later events only carry the fields that changed
   const startPolling = (id: string) => {
     clearPoll();
-    // initial immediate fetch
-    (async () => {
-      try {
-        const res = await fetch(`${API_BASE_URL}/progress?job_id=${id}`);
-        if (!res.ok) throw new Error("Failed to fetch progress");
-        const data = await res.json();
-        setProgress(data);
-      } catch (e) {
-        console.error(e);
+    const source = new EventSource(`${API_BASE_URL}/progress/stream?job_id=${id}`);
+    streamRef.current = source;
+    let latest: Partial<ProgressState> = {};
+
+    source.onmessage = (event) => {
+      const data = JSON.parse(event.data);
+      latest = { ...latest, ...data };
+      setProgress((prev) => ({ ...prev, ...data }));
+
+      if (data.status === "complete") {
+        clearPoll();
+        setUploading(false);
+        toast({
+          title: "Upload complete",
+          description: `Successfully processed ${latest.processed} products`,
+        });
+      } else if (data.status === "failed") {
+        clearPoll();
+        setUploading(false);
+        toast({
+          title: "Upload failed",
+          description: data.error || "An error occurred",
+          variant: "destructive"
+        });
+      } else if (data.status === "cancelled" || data.status === "paused") {
+        // a paused job only moves again once resumed, which starts a new stream
+        clearPoll();
+        setUploading(false);
+        toast({
+          title: data.status === "cancelled" ? "Import cancelled" : "Import paused",
+          description: latest.last_message || "",
+        });
       }
-    })();
+    };
 
-    // poll every second
-    const intervalId = window.setInterval(async () => {
-      try {
-        const response = await fetch(`${API_BASE_URL}/progress?job_id=${id}`);
-        if (!response.ok) throw new Error("Failed to fetch progress");
-        const data = await response.json();
-        setProgress(data);
-
-        if (data.status === "complete") {
-          clearPoll();
-          setUploading(false);
-          toast({
-            title: "Upload complete",
-            description: `Successfully processed ${data.processed} products`,
-          });
-        } else if (data.status === "failed") {
-          clearPoll();
-          setUploading(false);
-          toast({
-            title: "Upload failed",
-            description: data.error || "An error occurred",
-            variant: "destructive"
-          });
-        }
-      } catch (error) {
-        console.error("Error polling progress:", error);
-      }
-    }, 1000);
+    // stream is over once the job is final; stop the browser from reconnecting
+    source.addEventListener("end", () => clearPoll());
 
-    pollRef.current = intervalId;
+    source.onerror = (error) => {
+      console.error("Error streaming progress:", error);
+      // refused outright (e.g. 503, too many open streams): the browser won't retry, so we do
+      if (source.readyState === EventSource.CLOSED && streamRef.current === source) {
+        setTimeout(() => {
+          if (streamRef.current === source) startPolling(id);
+        }, 15000);
+      }
+    };
   };
 
   // fetch scheduled tasks on mount
@@ -114,13 +120,13 @@ const FileUpload = () => {
       }
     };
     loadTasks();
-    // clear polling on unmount
+    // close the progress stream on unmount
     return () => {
       clearPoll();
     };
   }, []);
 
-  // when jobId changes, start polling
+  // when jobId changes, start streaming its progress
   useEffect(() => {
     if (jobId) {
       startPolling(jobId);